@@ -0,0 +1,67 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+
+class BootJob(NamedTuple):
+    user_id: str
+    dc_id: int
+    start: Callable[[], Awaitable[None]]
+
+
+class Bootstrapper:
+    """Start user connections concurrently under global and per-DC limits
+
+    Jobs are started in the order given, so callers put the most recently
+    active users first. Progress and timings are kept for ``status()``.
+    """
+
+    def __init__(self, concurrency: int = 10, per_dc: int = 3):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_dc = per_dc
+        self.dc_semaphores: Dict[int, asyncio.Semaphore] = {}
+        self.total = 0
+        self.done = 0
+        self.failed: Dict[str, str] = {}
+        self.started_at: Optional[float] = None
+        self.first_live_at: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+
+    async def _start(self, job: BootJob):
+        dc_semaphore = self.dc_semaphores.setdefault(
+            job.dc_id, asyncio.Semaphore(self.per_dc)
+        )
+        # Per-DC slot first, so users queued on a busy DC do not hold global slots
+        async with dc_semaphore, self.semaphore:
+            try:
+                await job.start()
+                if self.first_live_at is None:
+                    self.first_live_at = time.monotonic()
+            except Exception as e:
+                self.failed[job.user_id] = str(e)
+                print(f"Failed to start user {job.user_id}: {str(e)}")
+            finally:
+                self.done += 1
+                if self.done % 10 == 0 or self.done == self.total:
+                    print(f"Startup progress: {self.done}/{self.total} users")
+
+    async def run(self, jobs: List[BootJob], phase: str = "startup"):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.total += len(jobs)
+        began = time.monotonic()
+        await asyncio.gather(*(self._start(job) for job in jobs))
+        self.phases[phase] = time.monotonic() - began
+        print(f"Startup phase '{phase}' took {self.phases[phase]:.2f}s for {len(jobs)} users")
+
+    def status(self) -> Dict:
+        return {
+            "total": self.total,
+            "done": self.done,
+            "failed": len(self.failed),
+            "failures": self.failed,
+            "time_to_first_live_seconds": (
+                self.first_live_at - self.started_at if self.first_live_at else None
+            ),
+            "phase_seconds": self.phases,
+        }
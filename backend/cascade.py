@@ -0,0 +1,76 @@
+import re
+from typing import Dict, List, Optional
+
+
+TICKER = re.compile(r"\$?[A-Za-z0-9]{2,12}")
+
+
+class ModelCascade:
+    """Routes alpha extraction through a fast model, escalating unsure windows
+
+    A window goes to the strong model when the fast model reports any token
+    below ``threshold`` confidence, or a token that is not a plain ticker
+    symbol (an indirect reference it could not pin down).
+    """
+
+    def __init__(self, fast_model: Optional[str], strong_model: Optional[str], threshold: float = 0.7):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.threshold = threshold
+        self.stats = {
+            tier: {"calls": 0, "windows": 0, "seconds": 0.0} for tier in ("fast", "strong")
+        }
+        self.escalated = {"low_confidence": 0, "ambiguous": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fast_model) and self.fast_model != self.strong_model
+
+    def escalation_reason(self, tokens) -> Optional[str]:
+        if not isinstance(tokens, list):
+            return "ambiguous"
+        for token in tokens:
+            if not isinstance(token, dict) or not TICKER.fullmatch(str(token.get("token", ""))):
+                return "ambiguous"
+            try:
+                confidence = float(token.get("confidence", 0))
+            except (TypeError, ValueError):
+                confidence = 0.0
+            if confidence < self.threshold:
+                return "low_confidence"
+        return None
+
+    def route(self, results: List) -> List[int]:
+        """Indices of the windows whose fast-model result should be re-run"""
+        escalate = []
+        for index, tokens in enumerate(results):
+            reason = self.escalation_reason(tokens)
+            if reason:
+                self.escalated[reason] += 1
+                escalate.append(index)
+        return escalate
+
+    def record(self, tier: str, windows: int, seconds: float):
+        self.stats[tier]["calls"] += 1
+        self.stats[tier]["windows"] += windows
+        self.stats[tier]["seconds"] += seconds
+
+    def metrics(self) -> Dict:
+        fast_windows = self.stats["fast"]["windows"]
+        return {
+            "enabled": self.enabled,
+            "fast_model": self.fast_model,
+            "strong_model": self.strong_model,
+            "threshold": self.threshold,
+            "tiers": {
+                tier: {
+                    **stats,
+                    "average_seconds": stats["seconds"] / stats["calls"] if stats["calls"] else 0.0,
+                }
+                for tier, stats in self.stats.items()
+            },
+            "escalated": self.escalated,
+            "escalation_rate": (
+                sum(self.escalated.values()) / fast_windows if fast_windows else 0.0
+            ),
+        }
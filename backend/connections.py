@@ -0,0 +1,274 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from telethon import TelegramClient, events, types, utils
+from telethon.sessions import StringSession
+
+from telegram_scheduler import RequestScheduler
+from ttl_cache import TTLCache
+
+
+# (user_id, group_id, event) for watched chats, (user_id, event) for private chats
+GroupMessageHandler = Callable[[str, int, Any], Awaitable[None]]
+PrivateMessageHandler = Callable[[str, Any], Awaitable[None]]
+ReconnectHandler = Callable[["UserConnection"], Awaitable[None]]
+
+CONNECTING = "connecting"
+LIVE = "live"
+BACKING_OFF = "backing_off"
+UNAUTHORIZED = "unauthorized"
+STOPPED = "stopped"
+
+
+def format_sender_name(sender) -> str:
+    first_name = getattr(sender, "first_name", "") or ""
+    last_name = getattr(sender, "last_name", "") or ""
+    sender_name = f"{first_name} {last_name}"
+    return sender_name.strip() or getattr(sender, "username", None) or "Unknown"
+
+
+class SessionExpired(Exception):
+    """Raised when a stored Telegram session is no longer authorized"""
+
+
+class UserConnection:
+    """A single authorized TelegramClient shared by every watched chat of a user
+
+    The client runs under a supervisor that reconnects it with jittered
+    exponential backoff whenever it drops, and records its health state.
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        client: TelegramClient,
+        on_group_message: GroupMessageHandler,
+        on_private_message: PrivateMessageHandler,
+        sender_names: Optional[TTLCache] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        on_reconnect: Optional[ReconnectHandler] = None,
+        backoff_base: float = 2,
+        backoff_max: float = 300,
+    ):
+        self.user_id = user_id
+        self.client = client
+        self.chats: Set[int] = set()
+        self.sender_names = sender_names if sender_names is not None else TTLCache()
+        self.task: Optional[asyncio.Task] = None
+        # Every outbound request of this account shares one flood-aware budget
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.state = CONNECTING
+        self.last_error: Optional[str] = None
+        self.reconnects = 0
+        self.live_since: Optional[float] = None
+        self.next_retry_at: Optional[float] = None
+        # (group_id, topic_id) -> wall-clock time of the last ingested message
+        self.last_message_at: Dict[Tuple[int, Optional[int]], float] = {}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._on_group_message = on_group_message
+        self._on_private_message = on_private_message
+        self._on_reconnect = on_reconnect
+
+    def start(self):
+        """Register the one NewMessage handler and supervise the update loop"""
+        self.client.add_event_handler(self._dispatch, events.NewMessage())
+        self.task = asyncio.create_task(self._supervise())
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _supervise(self):
+        attempt = 0
+        while True:
+            try:
+                if not self.client.is_connected():
+                    self.state = CONNECTING
+                    await self.client.connect()
+                    if not await self.client.is_user_authorized():
+                        self.state = UNAUTHORIZED
+                        self.last_error = "Session expired"
+                        await self.client.disconnect()
+                        return
+                    self.reconnects += 1
+                    if self._on_reconnect:
+                        asyncio.create_task(self._on_reconnect(self))
+                self.state = LIVE
+                self.live_since = time.time()
+                self.next_retry_at = None
+                attempt = 0
+                await self.client.run_until_disconnected()
+                self.last_error = "Disconnected"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Connection for {self.user_id} failed: {str(e)}")
+
+            delay = self._backoff(attempt)
+            attempt += 1
+            self.state = BACKING_OFF
+            self.live_since = None
+            self.next_retry_at = time.time() + delay
+            await asyncio.sleep(delay)
+
+    def health(self) -> Dict:
+        now = time.time()
+        return {
+            "state": self.state,
+            "last_error": self.last_error,
+            "reconnects": self.reconnects,
+            "live_for_seconds": now - self.live_since if self.live_since else None,
+            "next_retry_in_seconds": (
+                max(0.0, self.next_retry_at - now) if self.next_retry_at else None
+            ),
+        }
+
+    async def _dispatch(self, event):
+        if event.is_private:
+            if not event.out:
+                await self._on_private_message(self.user_id, event)
+            return
+
+        # Watch entries store the bare entity id, events carry the marked peer id
+        group_id, _ = utils.resolve_id(event.chat_id)
+        if group_id in self.chats:
+            await self._on_group_message(self.user_id, group_id, event)
+
+    def cache_senders(self, event):
+        """Cache the users that arrived with an update; they cost no request
+
+        Only events carry ``_entities``, so this runs in the handler, before
+        the bare message is buffered or ingested.
+        """
+        for entity in getattr(event, "_entities", {}).values():
+            if isinstance(entity, types.User) and entity.id not in self.sender_names:
+                self.sender_names.set(entity.id, format_sender_name(entity))
+
+    async def get_sender_name(self, message) -> str:
+        """Resolve a display name, only asking Telegram on a cold cache miss"""
+        name = self.sender_names.get(message.sender_id)
+        if name is None:
+            sender = message.sender or await self.scheduler.call("live", message.get_sender)
+            name = format_sender_name(sender)
+            self.sender_names.set(message.sender_id, name)
+        return name
+
+    async def send_message(self, recipient, message: str):
+        return await self.scheduler.call("send", self.client.send_message, recipient, message)
+
+    def add_chat(self, group_id: int):
+        self.chats.add(group_id)
+
+    def remove_chat(self, group_id: int):
+        self.chats.discard(group_id)
+
+    async def disconnect(self):
+        self.state = STOPPED
+        if self.task:
+            self.task.cancel()
+        self.client.remove_event_handler(self._dispatch)
+        if self.client.is_connected():
+            await self.client.disconnect()
+
+
+class ConnectionManager:
+    """Owns exactly one long-lived UserConnection per user"""
+
+    def __init__(
+        self,
+        on_group_message: GroupMessageHandler,
+        on_private_message: PrivateMessageHandler,
+        sender_cache_size: int = 4096,
+        sender_cache_ttl: float = 3600,
+        scheduler_rates: Optional[Dict[str, float]] = None,
+        on_reconnect: Optional[ReconnectHandler] = None,
+        backoff_base: float = 2,
+        backoff_max: float = 300,
+    ):
+        self.connections: Dict[str, UserConnection] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.sender_cache_size = sender_cache_size
+        self.sender_cache_ttl = sender_cache_ttl
+        self.scheduler_rates = scheduler_rates
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._on_reconnect = on_reconnect
+        self._on_group_message = on_group_message
+        self._on_private_message = on_private_message
+
+    def get_any(self, user_id: str) -> Optional[UserConnection]:
+        """The user's connection in whatever state it is in, for health reporting"""
+        return self.connections.get(user_id)
+
+    def get(self, user_id: str) -> Optional[UserConnection]:
+        connection = self.connections.get(user_id)
+        if connection and connection.client.is_connected():
+            return connection
+        return None
+
+    async def connect(
+        self, user_id: str, api_id: int, api_hash: str, session_string: str
+    ) -> UserConnection:
+        """Return the user's connection, connecting and authorizing it on first use"""
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            connection = self.get(user_id)
+            if connection:
+                return connection
+
+            # Flood waits surface to the RequestScheduler instead of sleeping inside Telethon
+            client = TelegramClient(
+                StringSession(session_string), api_id, api_hash, flood_sleep_threshold=0
+            )
+            await client.connect()
+            stale = self.connections.get(user_id)
+            if not await client.is_user_authorized():
+                await client.disconnect()
+                if stale:
+                    # Keep the dead connection around so its health stays visible
+                    await stale.disconnect()
+                    stale.state = UNAUTHORIZED
+                    stale.last_error = "Session expired"
+                raise SessionExpired(f"Session expired for user {user_id}")
+
+            if stale:
+                del self.connections[user_id]
+                await stale.disconnect()
+
+            connection = UserConnection(
+                user_id,
+                client,
+                self._on_group_message,
+                self._on_private_message,
+                TTLCache(self.sender_cache_size, self.sender_cache_ttl),
+                RequestScheduler(self.scheduler_rates),
+                self._on_reconnect,
+                self.backoff_base,
+                self.backoff_max,
+            )
+            if stale:
+                connection.chats = stale.chats
+                connection.sender_names = stale.sender_names
+                connection.scheduler = stale.scheduler
+                connection.last_message_at = stale.last_message_at
+                connection.reconnects = stale.reconnects + 1
+            connection.start()
+            self.connections[user_id] = connection
+            if stale and connection.chats and self._on_reconnect:
+                # The new client starts out live, so its supervisor never reports
+                # a reconnect; catch up on what the stale one missed here instead
+                asyncio.create_task(self._on_reconnect(connection))
+            return connection
+
+    async def disconnect(self, user_id: str):
+        connection = self.connections.pop(user_id, None)
+        if connection:
+            await connection.disconnect()
+
+    async def disconnect_all(self):
+        for user_id in list(self.connections):
+            await self.disconnect(user_id)
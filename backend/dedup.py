@@ -0,0 +1,140 @@
+import hashlib
+import itertools
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Set
+
+from ingest import IngestRecord
+
+
+WORD = re.compile(r"\w+")
+URL = re.compile(r"https?://\S+")
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64-bit SimHash over word shingles; near-identical texts differ in few bits"""
+    words = WORD.findall(URL.sub(" url ", text.lower()))
+    if len(words) < shingle:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i : i + shingle]) for i in range(len(words) - shingle + 1)]
+
+    counts = [0] * 64
+    for gram in grams:
+        h = int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            counts[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if counts[bit] > 0)
+
+
+class DupCluster:
+    def __init__(self, cluster_id: int, fingerprint: int, now: float):
+        self.cluster_id = cluster_id
+        self.fingerprint = fingerprint
+        self.first_seen = now
+        self.last_seen = now
+        self.groups: Set[int] = set()
+        # user_id -> groups whose copy of this message was delivered to that user
+        self.delivered: Dict[str, Set[int]] = {}
+        self.members: List[Hashable] = []
+
+
+class DedupIndex:
+    """Near-duplicate index over recent message text, shared by every watcher
+
+    Fingerprints are split into ``bands`` 16-bit bands; any two fingerprints
+    within ``max_distance`` <= bands - 1 bits share at least one band exactly,
+    so candidates come from band buckets instead of a full scan. Clusters
+    expire ``horizon`` seconds after they were last seen.
+
+    A copy is suppressed only when the same user already got the cluster from
+    a different group, so every user still gets one analysed item, annotated
+    with how many watched groups it appeared in. Repeats within one group are
+    a hype signal of their own and are always delivered.
+    """
+
+    def __init__(self, horizon: float = 3600, max_distance: int = 3, min_words: int = 6):
+        self.horizon = horizon
+        self.max_distance = max_distance
+        self.min_words = min_words
+        self.bands = 4
+        self.clusters: "OrderedDict[int, DupCluster]" = OrderedDict()
+        self.band_index: Dict[tuple, Set[int]] = {}
+        self.by_message: Dict[Hashable, DupCluster] = {}
+        self._ids = itertools.count()
+        self.checked = 0
+        self.suppressed = 0
+
+    def _bands(self, fingerprint: int) -> List[tuple]:
+        return [(i, fingerprint >> (16 * i) & 0xFFFF) for i in range(self.bands)]
+
+    def _expire(self, now: float):
+        while self.clusters:
+            cluster = next(iter(self.clusters.values()))
+            if now - cluster.last_seen < self.horizon:
+                break
+            del self.clusters[cluster.cluster_id]
+            for band in self._bands(cluster.fingerprint):
+                bucket = self.band_index.get(band)
+                if bucket:
+                    bucket.discard(cluster.cluster_id)
+                    if not bucket:
+                        del self.band_index[band]
+            for member in cluster.members:
+                self.by_message.pop(member, None)
+
+    def _find(self, fingerprint: int) -> Optional[DupCluster]:
+        for band in self._bands(fingerprint):
+            for cluster_id in self.band_index.get(band, ()):
+                cluster = self.clusters[cluster_id]
+                if bin(cluster.fingerprint ^ fingerprint).count("1") <= self.max_distance:
+                    return cluster
+        return None
+
+    @staticmethod
+    def _key(record: IngestRecord) -> Hashable:
+        return (record.user_id, record.group_id, record.message_id)
+
+    def check(self, record: IngestRecord) -> bool:
+        """Register a message; returns True if this user already has it from another group"""
+        text = record.message_text or ""
+        if len(WORD.findall(text)) < self.min_words:
+            return False
+
+        now = time.monotonic()
+        self._expire(now)
+        self.checked += 1
+        fingerprint = simhash(text)
+        cluster = self._find(fingerprint)
+        if cluster is None:
+            cluster = DupCluster(next(self._ids), fingerprint, now)
+            self.clusters[cluster.cluster_id] = cluster
+            for band in self._bands(fingerprint):
+                self.band_index.setdefault(band, set()).add(cluster.cluster_id)
+
+        delivered = cluster.delivered.setdefault(record.user_id, set())
+        duplicate = bool(delivered) and record.group_id not in delivered
+        cluster.groups.add(record.group_id)
+        cluster.last_seen = now
+        self.clusters.move_to_end(cluster.cluster_id)
+        if duplicate:
+            self.suppressed += 1
+        else:
+            delivered.add(record.group_id)
+            cluster.members.append(self._key(record))
+            self.by_message[self._key(record)] = cluster
+        return duplicate
+
+    def seen_in(self, record: IngestRecord) -> int:
+        """Number of watched groups this message's cluster has appeared in"""
+        cluster = self.by_message.get(self._key(record))
+        return len(cluster.groups) if cluster else 1
+
+    def metrics(self) -> Dict:
+        return {
+            "clusters": len(self.clusters),
+            "checked": self.checked,
+            "suppressed": self.suppressed,
+            "horizon_seconds": self.horizon,
+        }
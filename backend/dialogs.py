@@ -0,0 +1,179 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from telethon import functions
+
+
+class DialogIndex:
+    """A user's groups, supergroups and channels with lowercase lookup maps"""
+
+    def __init__(self):
+        self.entities: Dict[int, object] = {}
+        self.groups: Dict[int, dict] = {}
+        self.topics: Dict[int, List[dict]] = {}
+        self.by_title: Dict[str, int] = {}
+        self.by_username: Dict[str, int] = {}
+        self.newest: Optional[datetime] = None
+        self.fetched_at = 0.0
+
+    def add(self, dialog) -> bool:
+        """Index one dialog; returns True if it is a forum whose topics need loading"""
+        entity = dialog.entity
+        participants = getattr(entity, "participants_count", None)
+        if participants is None or participants < 1:
+            return False
+
+        group_info = {
+            "id": getattr(entity, "id", None),
+            "title": dialog.title,
+            "participants_count": participants,
+            "username": getattr(entity, "username", None),
+            "description": getattr(entity, "about", None),
+        }
+        if dialog.is_channel:
+            group_info["type"] = (
+                "supergroup" if getattr(entity, "megagroup", False) else "channel"
+            )
+        elif dialog.is_group:
+            group_info["type"] = "group"
+        else:
+            return False
+
+        is_forum = group_info["type"] == "supergroup" and getattr(entity, "forum", False)
+        if group_info["type"] == "supergroup":
+            group_info["is_forum"] = bool(is_forum)
+
+        self.entities[entity.id] = entity
+        self.groups[entity.id] = group_info
+        self.by_title[dialog.title.lower()] = entity.id
+        if group_info["username"]:
+            self.by_username[group_info["username"].lower()] = entity.id
+        if dialog.date and (self.newest is None or dialog.date > self.newest):
+            self.newest = dialog.date
+        return bool(is_forum)
+
+    def find(self, name: str):
+        """Look a group up by title or username, case-insensitively"""
+        name = name.lower().lstrip("@")
+        group_id = self.by_username.get(name) or self.by_title.get(name)
+        return self.entities.get(group_id) if group_id else None
+
+    def find_topic(self, group_id: int, topic_name: str) -> Optional[dict]:
+        topic_name = topic_name.lower()
+        for topic in self.topics.get(group_id, []):
+            if topic["title"].lower() == topic_name:
+                return topic
+        return None
+
+    def as_response(self) -> Dict:
+        grouped = {"group": [], "supergroup": [], "channel": []}
+        for group_id, group_info in self.groups.items():
+            group = dict(group_info)
+            if group.get("is_forum"):
+                group["topics"] = self.topics.get(group_id, [])
+            grouped[group["type"]].append(group)
+        return {
+            "regular_groups": grouped["group"],
+            "supergroups": grouped["supergroup"],
+            "channels": grouped["channel"],
+        }
+
+
+async def fetch_forum_topics(connection, channel, page_size: int = 100) -> List[dict]:
+    """Fetch every topic of a forum, following the pagination offsets"""
+    topics = []
+    offset_date, offset_id, offset_topic = 0, 0, 0
+    while True:
+        result = await connection.scheduler.call(
+            "listing",
+            connection.client,
+            functions.channels.GetForumTopicsRequest(
+                channel=channel,
+                offset_date=offset_date,
+                offset_id=offset_id,
+                offset_topic=offset_topic,
+                limit=page_size,
+            )
+        )
+        if not result.topics:
+            break
+
+        for topic in result.topics:
+            if getattr(topic, "title", None) is None:
+                continue  # ForumTopicDeleted
+            topics.append(
+                {
+                    "id": topic.id,
+                    "title": topic.title,
+                    "icon_color": getattr(topic, "icon_color", None),
+                    "icon_emoji": getattr(topic, "icon_emoji_id", None),
+                }
+            )
+
+        if len(result.topics) < page_size or len(topics) >= result.count:
+            break
+        last = result.topics[-1]
+        messages = {message.id: message for message in result.messages}
+        top_message = messages.get(getattr(last, "top_message", 0))
+        offset_topic = last.id
+        offset_id = getattr(last, "top_message", 0)
+        offset_date = top_message.date if top_message else getattr(last, "date", 0)
+    return topics
+
+
+class DialogIndexCache:
+    """Per-user DialogIndex with a TTL and incremental refresh
+
+    A stale index is refreshed by walking dialogs newest-first and stopping at
+    the first unpinned one that has not changed since the last fetch; only forums seen
+    in that walk have their topics re-fetched. ``refresh=True`` rebuilds it.
+    """
+
+    def __init__(self, ttl: float = 300, topic_concurrency: int = 5):
+        self.ttl = ttl
+        self.topic_concurrency = topic_concurrency
+        self.indexes: Dict[str, DialogIndex] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, user_id: str, connection, refresh: bool = False) -> DialogIndex:
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self.indexes.get(user_id)
+            if index is None or refresh:
+                # Full rebuild, which also drops dialogs the user has left
+                index = DialogIndex()
+                await self._refresh(index, connection)
+                self.indexes[user_id] = index
+            elif time.monotonic() - index.fetched_at > self.ttl:
+                await self._refresh(index, connection, since=index.newest)
+            return index
+
+    async def _refresh(self, index: DialogIndex, connection, since: Optional[datetime] = None):
+        forums = []
+        dialogs = connection.client.iter_dialogs()
+        async for dialog in connection.scheduler.iterate("listing", dialogs):
+            if since is not None and dialog.date and dialog.date <= since:
+                # Pinned dialogs are listed first whatever their date, so only
+                # an unpinned one marks where the unchanged part begins
+                if dialog.pinned:
+                    continue
+                break
+            if index.add(dialog):
+                forums.append(dialog.entity)
+
+        semaphore = asyncio.Semaphore(self.topic_concurrency)
+
+        async def load_topics(entity):
+            async with semaphore:
+                try:
+                    index.topics[entity.id] = await fetch_forum_topics(connection, entity)
+                except Exception as e:
+                    index.groups[entity.id]["topics_error"] = str(e)
+
+        await asyncio.gather(*(load_topics(entity) for entity in forums))
+        index.fetched_at = time.monotonic()
+
+    def invalidate(self, user_id: str):
+        self.indexes.pop(user_id, None)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from ingest import IngestRecord
+from windows import ConversationWindows, WindowKey, WindowSnapshot
+
+
+class TimerWheel:
+    """Hashed timer wheel: one ticking task serves every pending deadline"""
+
+    def __init__(self, tick: float = 1.0, slots: int = 64):
+        self.tick = tick
+        self.slots: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self.deadlines: Dict[Hashable, Tuple[float, int]] = {}
+        self.cursor = int(time.monotonic() / tick)
+
+    def schedule(self, key: Hashable, deadline: float):
+        self.cancel(key)
+        # Round up so a slot is only swept once all its deadlines have passed;
+        # deadlines already behind the cursor go into the next slot to be swept
+        slot = max(int(deadline / self.tick) + 1, self.cursor + 1) % len(self.slots)
+        self.deadlines[key] = (deadline, slot)
+        self.slots[slot].add(key)
+
+    def cancel(self, key: Hashable):
+        scheduled = self.deadlines.pop(key, None)
+        if scheduled is not None:
+            self.slots[scheduled[1]].discard(key)
+
+    def expire(self, now: float) -> List[Hashable]:
+        """Sweep every slot passed since the last call and pop the keys due by ``now``"""
+        due = []
+        current = int(now / self.tick)
+        first = max(self.cursor + 1, current - len(self.slots) + 1)
+        for tick in range(first, current + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for key in list(slot):
+                if self.deadlines[key][0] <= now:
+                    slot.discard(key)
+                    del self.deadlines[key]
+                    due.append(key)
+        self.cursor = max(self.cursor, current)
+        return due
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+
+class FlushScheduler:
+    """Flush conversation windows on size, token budget or age, whichever is first
+
+    Size and token triggers fire inline from ``add``; age triggers fire from a
+    single timer wheel instead of one timer per conversation.
+    """
+
+    def __init__(
+        self,
+        windows: ConversationWindows,
+        on_flush: Callable[[WindowSnapshot], Awaitable[None]],
+        tick: float = 1.0,
+        slots: int = 64,
+    ):
+        self.windows = windows
+        self.on_flush = on_flush
+        self.wheel = TimerWheel(tick, slots)
+        self.task: Optional[asyncio.Task] = None
+        self.pending: Set[asyncio.Task] = set()
+        self.flushes = {"size": 0, "age": 0}
+
+    def start(self):
+        if not self.task:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def add(self, record: IngestRecord):
+        window, snapshot = self.windows.append(record)
+        if snapshot:
+            self.wheel.cancel(window.key)
+            self.flushes["size"] += 1
+        # A token-triggered flush leaves the new message pending in a fresh window
+        if window.fresh == 1:
+            self.wheel.schedule(window.key, window.deadline)
+        if snapshot:
+            await self.on_flush(snapshot)
+
+    def _flush_due(self, key: WindowKey):
+        window = self.windows.windows.get(key)
+        snapshot = window.flush() if window else None
+        if not snapshot:
+            return
+        self.flushes["age"] += 1
+        # Run off the wheel so a slow analysis never delays other deadlines
+        task = asyncio.create_task(self.on_flush(snapshot))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for key in self.wheel.expire(time.monotonic()):
+                try:
+                    self._flush_due(key)
+                except Exception as e:
+                    print(f"Error flushing window {key}: {str(e)}")
+
+    def metrics(self) -> Dict:
+        return {
+            "scheduled": len(self.wheel),
+            "in_flight": len(self.pending),
+            "flushes": dict(self.flushes),
+        }
@@ -0,0 +1,84 @@
+import re
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+# Words (with $cashtags and contractions) and single emoji
+WORD = re.compile(r"[a-z0-9$']+|[\U0001F300-\U0001FAFF☀-➿]")
+
+
+def weights_path(path: str) -> str:
+    # np.savez_compressed appends .npz when it is missing; load must read the same file
+    return path if path.endswith(".npz") else f"{path}.npz"
+
+
+class HashedLogisticModel(ABC):
+    """Logistic model over crc32-hashed sparse text features
+
+    Subclasses turn a text into ``(feature, value)`` pairs and may provide
+    ``SEED_WEIGHTS`` so the model is useful before it has been trained.
+    Weights live in one NumPy vector, so a batch of texts is scored in a
+    single vectorised pass.
+    """
+
+    SEED_WEIGHTS: Dict[str, float] = {}
+
+    def __init__(self, buckets: int = 2**18, bias: float = 0.0):
+        self.buckets = buckets
+        self.bias = bias
+        self.weights = np.zeros(buckets, dtype=np.float32)
+        for feature, weight in self.SEED_WEIGHTS.items():
+            self.weights[self._hash(feature)] = weight
+
+    def _hash(self, feature: str) -> int:
+        # crc32 rather than hash() so weights stay valid across processes
+        return zlib.crc32(feature.encode()) % self.buckets
+
+    @abstractmethod
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        """(feature, value) pairs for one text"""
+
+    def _matrix(self, texts: List[str]):
+        rows, columns, values = [], [], []
+        for row, text in enumerate(texts):
+            for feature, value in self.features(text):
+                rows.append(row)
+                columns.append(self._hash(feature))
+                values.append(value)
+        return (
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(columns, dtype=np.int64),
+            np.asarray(values, dtype=np.float32),
+        )
+
+    def predict(self, texts: List[str]) -> np.ndarray:
+        """Positive-class probability for each text"""
+        rows, columns, values = self._matrix(texts)
+        contributions = self.weights[columns] * values
+        z = self.bias + np.bincount(rows, weights=contributions, minlength=len(texts))
+        return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+    def score(self, text: str) -> float:
+        return float(self.predict([text])[0])
+
+    def train(self, texts: List[str], labels: List[bool], epochs: int = 10, lr: float = 0.1):
+        """Batch gradient descent on labelled texts"""
+        rows, columns, values = self._matrix(texts)
+        y = np.asarray(labels, dtype=np.float32)
+        for _ in range(epochs):
+            error = y - self.predict(texts)
+            self.bias += lr * float(error.mean())
+            np.add.at(self.weights, columns, lr * error[rows] * values)
+
+    def save(self, path: str):
+        np.savez_compressed(weights_path(path), weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path: str) -> "HashedLogisticModel":
+        data = np.load(weights_path(path))
+        model = cls(len(data["weights"]), float(data["bias"]))
+        model.weights = data["weights"]
+        return model
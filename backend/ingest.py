@@ -0,0 +1,141 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+DROP_POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+
+class IngestRecord(NamedTuple):
+    """Compact message record handed from Telegram handlers to analysis workers"""
+
+    user_id: str
+    group_id: int
+    topic_id: Optional[int]
+    group_name: str
+    topic_name: Optional[str]
+    sender_name: str
+    message_text: str
+    received_at: float
+    message_id: Optional[int] = None
+
+
+class IngestQueue:
+    """Bounded queue drained by a pool of analysis workers
+
+    Handlers only ``put`` records, so a slow analysis step never stalls the
+    Telegram update loop. When the queue is full the drop policy decides:
+
+    - ``drop_newest``: reject the incoming record
+    - ``drop_oldest``: evict the oldest queued record to make room
+    - ``block``: wait up to ``put_timeout`` seconds for room, then drop
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[IngestRecord], Awaitable[None]],
+        maxsize: int = 1000,
+        workers: int = 4,
+        drop_policy: str = DROP_OLDEST,
+        put_timeout: float = 1.0,
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.drop_policy = drop_policy
+        self.put_timeout = put_timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+
+    def start(self):
+        if self.tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self.tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def put_wait(self, record: IngestRecord):
+        """Enqueue a record, waiting for room instead of dropping (used for replay)"""
+        if self.queue is None:
+            self.start()
+        await self.queue.put(record)
+        self._record_put()
+
+    async def put(self, record: IngestRecord) -> bool:
+        """Enqueue a record, applying the drop policy when full. Returns False if dropped"""
+        if self.queue is None:
+            self.start()
+
+        if self.queue.full():
+            if self.drop_policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            if self.drop_policy == DROP_OLDEST:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                except asyncio.QueueEmpty:
+                    pass
+            else:
+                try:
+                    await asyncio.wait_for(self.queue.put(record), self.put_timeout)
+                    self._record_put()
+                    return True
+                except asyncio.TimeoutError:
+                    self.dropped += 1
+                    return False
+
+        self.queue.put_nowait(record)
+        self._record_put()
+        return True
+
+    def _record_put(self):
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _worker(self, worker_id: int):
+        while True:
+            record = await self.queue.get()
+            self.total_wait += time.monotonic() - record.received_at
+            try:
+                await self.handler(record)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Ingest worker {worker_id} failed: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def metrics(self) -> Dict:
+        handled = self.processed + self.failed
+        return {
+            "depth": self.queue.qsize() if self.queue else 0,
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "workers": len(self.tasks),
+            "drop_policy": self.drop_policy,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_queue_wait_seconds": self.total_wait / handled if handled else 0.0,
+        }
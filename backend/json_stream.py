@@ -0,0 +1,73 @@
+from typing import Any, AsyncIterator
+
+from pydantic_core import from_json
+
+
+async def strip_reasoning(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Drop a leading <think>...</think> block from a streamed completion"""
+    buffer = ""
+    thinking = None
+    async for chunk in chunks:
+        buffer += chunk
+        if thinking is None:
+            head = buffer.lstrip()
+            if len(head) < len("<think>") and "<think>".startswith(head):
+                continue
+            thinking = head.startswith("<think>")
+        if thinking:
+            end = buffer.find("</think>")
+            if end == -1:
+                # Only the tail can still hold the start of the closing tag
+                buffer = buffer[-len("</think>"):]
+                continue
+            buffer = buffer[end + len("</think>"):]
+            thinking = False
+        if buffer:
+            yield buffer
+            buffer = ""
+
+
+async def iter_array_items(chunks: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """Yield each element of a streamed top-level JSON array as soon as it closes
+
+    Anything before the first ``[`` (prose, a stray object) is ignored. A
+    stream that ends before the array closes raises ``ValueError``, so the
+    caller does not mistake a cut-off reply for a complete one.
+    """
+    started = False
+    depth = 0
+    in_string = False
+    escaped = False
+    item = []
+    async for chunk in chunks:
+        for char in chunk:
+            if not started:
+                if char == "[":
+                    started = True
+                    depth = 1
+                continue
+            if depth >= 2:
+                item.append(char)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                continue
+
+            if char == '"':
+                in_string = True
+            elif char in "[{":
+                depth += 1
+                if depth == 2:
+                    item = [char]
+            elif char in "]}":
+                depth -= 1
+                if depth == 1:
+                    yield from_json("".join(item), allow_inf_nan=True)
+                    item = []
+                elif depth == 0:
+                    return
+    raise ValueError("Stream ended before the JSON array was complete")
@@ -0,0 +1,255 @@
+import asyncio
+import random
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence
+
+import httpx
+from groq import (
+    APIConnectionError,
+    AsyncGroq,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+
+from json_stream import strip_reasoning
+from llm_admission import LLMAdmission
+from llm_cache import ResponseCache, cache_key
+
+
+# Transient failures worth another attempt; bad requests and auth errors are not.
+# IndexError covers a reasoning reply that was cut off before "</think>".
+RETRYABLE = (APIConnectionError, RateLimitError, InternalServerError, IndexError)
+
+
+def strip_think(output: str) -> str:
+    """The answer after a reasoning model's <think> block; other models pass through"""
+    if "</think>" in output:
+        return output.split("</think>", 1)[1]
+    if output.lstrip().startswith("<think>"):
+        raise IndexError("Reasoning was cut off before </think>")
+    return output
+
+
+class LLMGateway:
+    """Every Groq completion goes through one shared AsyncGroq client
+
+    The underlying HTTP connection pool is kept alive between calls, each call
+    has its own timeout, and transient failures are retried with jittered
+    exponential backoff instead of hammering the API immediately.
+
+    With a ``cache``, identical prompts of the same ``kind`` are answered from
+    it. A reply is only cached once the caller's ``parse`` accepted it, so a
+    truncated or malformed reply is never served again; ``bypass_cache`` forces live calls (still refreshing the cache) so
+    cached and live behaviour can be compared. With an ``admission`` gate,
+    calls are rate limited and identical in-flight prompts are coalesced.
+
+    In ``structured`` mode, ``json_mode`` calls request a JSON object response
+    and are capped at a per-kind ``max_tokens``. Models matching a
+    ``reasoning_models`` prefix also keep reasoning out of the content
+    (optionally at a lower effort); hidden reasoning still spends completion
+    tokens, so their cap is raised by ``reasoning_tokens``. Other models are
+    never sent the reasoning options.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        model: Optional[str],
+        timeout: float = 60,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10,
+        max_connections: int = 20,
+        cache: Optional[ResponseCache] = None,
+        bypass_cache: bool = False,
+        admission: Optional[LLMAdmission] = None,
+        structured: bool = False,
+        max_tokens: Optional[Dict[str, int]] = None,
+        reasoning_format: Optional[str] = "hidden",
+        reasoning_effort: Optional[str] = None,
+        reasoning_models: Sequence[str] = (),
+        reasoning_tokens: int = 2048,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        self.bypassed = 0
+        self.admission = admission
+        self.structured = structured
+        self.max_tokens = max_tokens or {}
+        self.reasoning_format = reasoning_format
+        self.reasoning_effort = reasoning_effort
+        self.reasoning_models = tuple(reasoning_models)
+        self.reasoning_tokens = reasoning_tokens
+        self._client: Optional[AsyncGroq] = None
+
+    @property
+    def client(self) -> AsyncGroq:
+        # Created on first use so the app can start without GROQ_API_KEY set
+        if self._client is None:
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=120,
+                    ),
+                ),
+            )
+        return self._client
+
+    def is_reasoning_model(self, model: Optional[str]) -> bool:
+        return bool(model) and model.startswith(self.reasoning_models)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def generate(
+        self,
+        prompt: str,
+        kind: str = "default",
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+        json_mode: bool = False,
+        max_tokens: Optional[int] = None,
+        parse: Optional[Callable[[str], Any]] = None,
+    ) -> Any:
+        """Complete a single-message prompt and return the text after the reasoning
+
+        With ``parse``, its result is returned instead; if it raises, the
+        error propagates and the reply is not cached.
+        """
+        model = model or self.model
+        options = {}
+        if self.structured and json_mode:
+            options["response_format"] = {"type": "json_object"}
+            max_tokens = max_tokens or self.max_tokens.get(kind)
+            if self.is_reasoning_model(model):
+                if self.reasoning_format:
+                    options["reasoning_format"] = self.reasoning_format
+                if self.reasoning_effort:
+                    options["reasoning_effort"] = self.reasoning_effort
+                if max_tokens:
+                    max_tokens += self.reasoning_tokens
+            if max_tokens:
+                options["max_completion_tokens"] = max_tokens
+        key = cache_key(model, prompt, options)
+        if self.cache is not None:
+            if self.bypass_cache:
+                self.bypassed += 1
+            else:
+                cached = await self.cache.get(key, kind)
+                if cached is not None:
+                    if parse is None:
+                        return cached
+                    try:
+                        return parse(cached)
+                    except Exception as e:
+                        # Cached before replies were validated; ask again
+                        print(f"Dropping unparseable cached {kind} reply: {str(e)}")
+                        await self.cache.invalidate(key)
+
+        async def call() -> Any:
+            output = await self._complete(prompt, timeout, model, options)
+            result = parse(output) if parse else output
+            if self.cache is not None:
+                await self.cache.set(key, kind, output)
+            return result
+
+        if self.admission is None:
+            return await call()
+        return await self.admission.run(
+            (kind, key), kind, prompt, call, options.get("max_completion_tokens")
+        )
+
+    async def _complete(
+        self, prompt: str, timeout: Optional[float], model: str, options: Dict
+    ) -> str:
+        for attempt in range(self.retries):
+            try:
+                response = await self.client.chat.completions.create(
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt,
+                        }
+                    ],
+                    model=model,
+                    stream=False,
+                    timeout=timeout or self.timeout,
+                    **options,
+                )
+                return strip_think(response.choices[0].message.content)
+
+            except RETRYABLE as e:
+                if attempt == self.retries - 1:
+                    raise Exception(f"Failed after {self.retries} retries: {str(e)}")
+                delay = self._backoff(attempt)
+                print(f"Attempt {attempt + 1} failed, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+    async def stream(
+        self, prompt: str, kind: str = "default", timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Stream the completion text, with the reasoning block already dropped
+
+        Only opening the stream is retried; once text has been yielded a
+        failure propagates to the caller. Streamed calls skip the cache.
+        """
+        if self.admission is not None:
+            await self.admission.admit(kind, prompt)
+        for attempt in range(self.retries):
+            try:
+                response = await self.client.chat.completions.create(
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt,
+                        }
+                    ],
+                    model=self.model,
+                    stream=True,
+                    timeout=timeout or self.timeout,
+                )
+                break
+
+            except RETRYABLE as e:
+                if attempt == self.retries - 1:
+                    raise Exception(f"Failed after {self.retries} retries: {str(e)}")
+                delay = self._backoff(attempt)
+                print(f"Attempt {attempt + 1} failed, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+        async def content():
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        async for text in strip_reasoning(content()):
+            yield text
+
+    def cache_metrics(self) -> Dict:
+        if self.cache is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "bypass": self.bypass_cache,
+            "bypassed": self.bypassed,
+            **self.cache.metrics(),
+        }
+
+    async def close(self):
+        if self.cache is not None:
+            self.cache.close()
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
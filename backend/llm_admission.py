@@ -0,0 +1,105 @@
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from rate_limit import TokenBucket
+from token_budget import count_tokens
+
+
+# Prompt kinds in priority order: validating a found alpha is on the trade path,
+# extracting new alphas can wait behind it
+PRIORITIES = {
+    "sentiment": 0,
+    "tweets": 0,
+    "alpha": 1,
+    "default": 2,
+}
+
+
+class LLMAdmission:
+    """Process-wide gate in front of the LLM API
+
+    Requests wait in a priority queue until both the requests-per-minute and
+    the tokens-per-minute bucket can cover them. Identical requests already in
+    flight are coalesced: later callers await the first caller's result.
+    """
+
+    def __init__(self, rpm: float = 30, tpm: float = 6000, output_tokens: int = 1024):
+        self.requests = TokenBucket(rpm / 60, rpm)
+        self.tokens = TokenBucket(tpm / 60, tpm)
+        self.output_tokens = output_tokens
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        self.stats = {
+            kind: {"admitted": 0, "coalesced": 0} for kind in PRIORITIES
+        }
+
+    def _pump_waiters(self):
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        while self._waiters:
+            _, _, cost, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = max(self.requests.delay(1), self.tokens.delay(cost))
+            if delay > 0:
+                # Re-check the head afterwards; a more urgent request may have arrived
+                await asyncio.sleep(delay)
+                continue
+            self.requests.try_acquire(1)
+            self.tokens.try_acquire(cost)
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+    async def admit(self, kind: str, prompt: str, output_tokens: Optional[int] = None):
+        """Wait for this prompt's turn under the RPM/TPM budget"""
+        cost = min(
+            count_tokens(prompt) + (output_tokens or self.output_tokens),
+            self.tokens.capacity,
+        )
+        future = asyncio.get_running_loop().create_future()
+        priority = PRIORITIES.get(kind, PRIORITIES["default"])
+        heapq.heappush(self._waiters, (priority, next(self._seq), cost, future))
+        self._pump_waiters()
+        await future
+        self.stats.setdefault(kind, {"admitted": 0, "coalesced": 0})["admitted"] += 1
+
+    async def run(
+        self,
+        key: Hashable,
+        kind: str,
+        prompt: str,
+        func: Callable[[], Awaitable[str]],
+        output_tokens: Optional[int] = None,
+    ) -> str:
+        """Admit and run ``func`` once per ``key``, sharing the result with duplicates"""
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.stats.setdefault(kind, {"admitted": 0, "coalesced": 0})["coalesced"] += 1
+        else:
+            task = asyncio.create_task(self._run(key, kind, prompt, func, output_tokens))
+            self.in_flight[key] = task
+        # Shielded so one caller giving up does not cancel it for the others
+        return await asyncio.shield(task)
+
+    async def _run(self, key, kind, prompt, func, output_tokens) -> str:
+        try:
+            await self.admit(kind, prompt, output_tokens)
+            return await func()
+        finally:
+            self.in_flight.pop(key, None)
+
+    def metrics(self) -> Dict:
+        return {
+            "queued": len(self._waiters),
+            "in_flight": len(self.in_flight),
+            "requests_available": round(self.requests.tokens, 1),
+            "tokens_available": round(self.tokens.tokens),
+            "kinds": self.stats,
+        }
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from ttl_cache import TTLCache
+
+
+DEFAULT_TTLS = {
+    "alpha": 300,
+    "tweets": 1800,
+    "sentiment": 1800,
+}
+
+
+def cache_key(model: Optional[str], prompt: str, options: Optional[Dict] = None) -> str:
+    """Content address of a prompt and its request options; whitespace does not matter
+
+    Options such as ``response_format`` and the output cap change the reply,
+    so the same prompt sent in another mode gets its own entry.
+    """
+    normalized = " ".join(prompt.split())
+    params = json.dumps(options or {}, sort_keys=True)
+    return hashlib.sha256(f"{model}\0{params}\0{normalized}".encode()).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: an in-memory LRU in front of SQLite
+
+    Entries expire after a TTL chosen by prompt kind. The SQLite tier keeps
+    responses across restarts; it is accessed from a worker thread so disk I/O
+    never blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        maxsize: int = 2048,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 300,
+    ):
+        self.memory = TTLCache(maxsize)
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._db = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, kind TEXT, response TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+
+    def ttl(self, kind: str) -> float:
+        return self.ttls.get(kind, self.default_ttl)
+
+    def _count(self, kind: str, outcome: str):
+        stats = self.stats.setdefault(
+            kind, {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        )
+        stats[outcome] += 1
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+
+    def _disk_set(self, key: str, kind: str, response: str, expires_at: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, kind, response, expires_at),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    async def get(self, key: str, kind: str) -> Optional[str]:
+        response = self.memory.get(key)
+        if response is not None:
+            self._count(kind, "memory_hits")
+            return response
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._disk_get, key)
+            if row is not None:
+                response, expires_at = row
+                self.memory.set(key, response, expires_at - time.time())
+                self._count(kind, "disk_hits")
+                return response
+
+        self._count(kind, "misses")
+        return None
+
+    async def set(self, key: str, kind: str, response: str):
+        ttl = self.ttl(kind)
+        self.memory.set(key, response, ttl)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, kind, response, time.time() + ttl)
+
+    def _disk_delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    async def invalidate(self, key: str):
+        self.memory.pop(key)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_delete, key)
+
+    def metrics(self) -> Dict:
+        return {
+            "memory_entries": len(self.memory),
+            "ttls": self.ttls,
+            "kinds": {
+                kind: {
+                    **stats,
+                    "hit_rate": (
+                        (stats["memory_hits"] + stats["disk_hits"])
+                        / max(1, sum(stats.values()))
+                    ),
+                }
+                for kind, stats in self.stats.items()
+            },
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,164 @@
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ingest import IngestRecord
+from windows import WindowSnapshot
+
+
+ChatKey = Tuple[str, int]
+ConversationKey = Tuple[str, int, Optional[int]]
+
+
+class MessageLog:
+    """Segmented append-only log of every ingested message
+
+    Two watermarks make restarts cheap and at-least-once:
+
+    - ``last_message_id`` per (user, chat): the newest message logged, used as
+      ``min_id`` when catching up from Telegram
+    - ``committed`` per (user, chat, topic): the newest message whose window was
+      analysed; anything logged after it is replayed on start
+
+    Both are checkpointed to ``watermarks.json``, so a quiet chat keeps its
+    watermark after its records are pruned with old segments. Windows are
+    committed in flush order, so one that finishes early never moves the
+    watermark past an older window still being analysed.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 8 * 1024 * 1024,
+        max_segments: int = 16,
+        fsync: bool = False,
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.fsync = fsync
+        self.last_ids: Dict[ChatKey, int] = {}
+        self.committed: Dict[ConversationKey, int] = {}
+        # Windows analysed ahead of an older one of the same conversation: seq -> message id
+        self._finished: Dict[ConversationKey, Dict[int, int]] = {}
+        self._next_seq: Dict[ConversationKey, int] = {}
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def _watermark_path(self) -> str:
+        return os.path.join(self.directory, "watermarks.json")
+
+    def _segments(self) -> List[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+
+    def _load(self):
+        if os.path.exists(self._watermark_path):
+            with open(self._watermark_path) as f:
+                data = json.load(f)
+            self.committed = {
+                (user_id, group_id, topic_id): message_id
+                for user_id, group_id, topic_id, message_id in data.get("committed", [])
+            }
+            self.last_ids = {
+                (user_id, group_id): message_id
+                for user_id, group_id, message_id in data.get("last_ids", [])
+            }
+        for record in self.records():
+            self._advance(record)
+
+    def _advance(self, record: IngestRecord):
+        key = (record.user_id, record.group_id)
+        if record.message_id and record.message_id > self.last_ids.get(key, 0):
+            self.last_ids[key] = record.message_id
+
+    def _open_segment(self):
+        segments = self._segments()
+        index = int(segments[-1][8:-4]) if segments else 0
+        path = os.path.join(self.directory, f"segment-{index:08d}.log")
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+            path = os.path.join(self.directory, f"segment-{index + 1:08d}.log")
+        self._file = open(path, "a", encoding="utf-8")
+        pruned = self._segments()[: -self.max_segments]
+        if pruned:
+            # The pruned records may hold a quiet chat's only copy of its watermark
+            self.checkpoint()
+        for name in pruned:
+            os.remove(os.path.join(self.directory, name))
+
+    def append(self, record: IngestRecord):
+        if self._file is None or self._file.tell() >= self.segment_size:
+            self.close()
+            self._open_segment()
+        self._file.write(json.dumps(record._asdict()) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._advance(record)
+
+    def records(self) -> Iterator[IngestRecord]:
+        for name in self._segments():
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield IngestRecord(**json.loads(line))
+                    except (ValueError, TypeError):
+                        # A torn final line from a crash; everything before it is intact
+                        continue
+
+    def last_message_id(self, user_id: str, group_id: int) -> int:
+        return self.last_ids.get((user_id, group_id), 0)
+
+    def uncommitted(self) -> Iterator[IngestRecord]:
+        """Logged messages whose window was never analysed, in log order"""
+        for record in self.records():
+            key = (record.user_id, record.group_id, record.topic_id)
+            if (record.message_id or 0) > self.committed.get(key, 0):
+                yield record._replace(received_at=time.monotonic())
+
+    def commit(self, snapshot: WindowSnapshot):
+        """Mark a window analysed; the watermark only moves over windows analysed in order"""
+        key = snapshot.key
+        finished = self._finished.setdefault(key, {})
+        finished[snapshot.seq] = max(
+            (m.message_id or 0 for m in snapshot.messages), default=0
+        )
+        seq = self._next_seq.get(key, 0)
+        message_id = self.committed.get(key, 0)
+        while seq in finished:
+            message_id = max(message_id, finished.pop(seq))
+            seq += 1
+        self._next_seq[key] = seq
+        if not finished:
+            del self._finished[key]
+        if message_id <= self.committed.get(key, 0):
+            return
+        self.committed[key] = message_id
+        self.checkpoint()
+
+    def checkpoint(self):
+        data = {
+            "committed": [
+                [user_id, group_id, topic_id, message_id]
+                for (user_id, group_id, topic_id), message_id in self.committed.items()
+            ],
+            "last_ids": [
+                [user_id, group_id, message_id]
+                for (user_id, group_id), message_id in self.last_ids.items()
+            ],
+        }
+        tmp_path = self._watermark_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._watermark_path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,71 @@
+import re
+from typing import Dict, List
+
+from relevance import BASE58_ADDRESS, EVM_ADDRESS
+from token_budget import count_tokens
+
+
+URL = re.compile(r"https?://([^/\s]+)\S*|www\.([^/\s]+)\S*")
+EMOJI_RUN = re.compile(r"[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D]{2,}")
+WHITESPACE = re.compile(r"\s+")
+
+
+def _shorten_url(match: re.Match) -> str:
+    # Keep the domain and any contract address in the link, drop the rest
+    url = match.group(0)
+    domain = match.group(1) or match.group(2)
+    address = EVM_ADDRESS.search(url) or BASE58_ADDRESS.search(url)
+    return f"<{domain} {address.group(0)}>" if address else f"<{domain}>"
+
+
+def _squash_emoji(match: re.Match) -> str:
+    unique = dict.fromkeys(char for char in match.group(0) if char not in "\ufe0f\u200d")
+    return "".join(list(unique)[:3])
+
+
+def normalize_text(text: str, max_chars: int) -> str:
+    text = URL.sub(_shorten_url, text or "")
+    text = EMOJI_RUN.sub(_squash_emoji, text)
+    text = WHITESPACE.sub(" ", text).strip()
+    if len(text) > max_chars:
+        text = text[:max_chars].rstrip() + "…"
+    return text
+
+
+def compact_window(messages: List[Dict], budget: int = 1200, max_chars: int = 400) -> str:
+    """Render a window as a header plus one ``sender: text`` line per message
+
+    Group and topic are written once. Overlap messages are prefixed with
+    ``~`` and cross-posted ones carry ``(xN groups)``. If the window is over
+    ``budget`` tokens, overlap messages are dropped first, then the oldest
+    new ones, so the newest messages always make it into the prompt.
+    """
+    if not messages:
+        return ""
+    first = messages[0]
+    header = f"Group: {first['group_name']}"
+    if first.get("topic_name"):
+        header += f" / Topic: {first['topic_name']}"
+
+    lines = []
+    for message in messages:
+        line = f"{message['sender_name']}: {normalize_text(message['message_text'], max_chars)}"
+        if message.get("seen_in_groups", 1) > 1:
+            line += f" (x{message['seen_in_groups']} groups)"
+        lines.append(("~" if message.get("overlap") else "") + line)
+
+    remaining = budget - count_tokens(header)
+    kept = []
+    # Newest first, so whatever is cut is the oldest context
+    for line in reversed(lines):
+        cost = count_tokens(line) + 1
+        if cost > remaining:
+            break
+        kept.append(line)
+        remaining -= cost
+    kept.reverse()
+
+    omitted = len(lines) - len(kept)
+    if omitted:
+        header += f" ({omitted} earlier messages omitted)"
+    return "\n".join([header, *kept])
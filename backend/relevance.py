@@ -0,0 +1,149 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from hashed_model import WORD, HashedLogisticModel
+
+
+CASHTAG = re.compile(r"\$[A-Za-z][A-Za-z0-9]{1,9}\b")
+EVM_ADDRESS = re.compile(r"\b0x[a-fA-F0-9]{40}(?:[a-fA-F0-9]{24})?\b")
+BASE58_ADDRESS = re.compile(r"\b[1-9A-HJ-NP-Za-km-z]{32,44}\b")
+TICKER = re.compile(r"\b[A-Z]{2,6}\b")
+
+# Scores of a few labelled messages with the seed weights below; the default
+# threshold sits between the lowest relevant and the highest chatter score:
+#   0.88  $PEPE                                       relevant
+#   0.73  0x52908400098527886e0f7030069857d2e4169ee7  relevant
+#   0.62  buying ETH here                             relevant
+#   0.38  BTC looking strong                          relevant
+#   0.38  ETH                                         relevant
+#   0.31  new listing today                           relevant
+#   0.31  pumping hard, who's in                      relevant
+#   0.27  OK thanks                                   chatter
+#   0.12  see you all tomorrow                        chatter
+#   0.05  gm frens                                    chatter
+DEFAULT_THRESHOLD = 0.3
+
+OFF = "off"
+SHADOW = "shadow"
+ENFORCE = "enforce"
+
+# Seed weights so the gate is useful before it has been trained on our own
+# logs; word keys are stems, so "buy" also covers "buying" and "buys"
+SEED_WEIGHTS = {
+    "__cashtag__": 2.5,
+    "__address__": 3.0,
+    "__ticker__": 1.5,
+    "token": 1.2,
+    "coin": 1.0,
+    "buy": 1.0,
+    "sell": 1.0,
+    "pump": 1.2,
+    "dump": 1.2,
+    "moon": 0.8,
+    "list": 1.2,
+    "launch": 1.0,
+    "presale": 1.5,
+    "airdrop": 1.2,
+    "contract": 1.0,
+    "ca": 1.0,
+    "chart": 0.8,
+    "mcap": 1.2,
+    "market cap": 1.2,
+    "entry": 0.6,
+    "long": 0.5,
+    "short": 0.5,
+    "bullish": 1.0,
+    "bearish": 1.0,
+    "rug": 1.2,
+    "100x": 1.2,
+    "gm": -1.0,
+    "gn": -1.0,
+    "lol": -0.6,
+    "haha": -0.6,
+    "thank": -0.5,
+    "welcome": -0.5,
+}
+
+
+def stem(word: str) -> str:
+    """Strip common English inflections, so buying and buys both count as buy"""
+    if word.startswith("$"):
+        return word
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[: -len(suffix)]
+            # pumped -> pump, but rugged -> rug and selling -> sell
+            if word[-1] == word[-2] and word[-1] not in "aeiouls":
+                word = word[:-1]
+            return word
+    if word.endswith("es") and word[:-2].endswith(("ch", "sh", "ss", "x")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+class RelevanceModel(HashedLogisticModel):
+    """Logistic model over hashed word unigrams/bigrams plus pattern features"""
+
+    SEED_WEIGHTS = SEED_WEIGHTS
+
+    def __init__(self, buckets: int = 2**18, bias: float = -2.0):
+        super().__init__(buckets, bias)
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        features = []
+        if CASHTAG.search(text):
+            features.append("__cashtag__")
+        if EVM_ADDRESS.search(text) or BASE58_ADDRESS.search(text):
+            features.append("__address__")
+        if TICKER.search(text):
+            features.append("__ticker__")
+        words = [stem(word) for word in WORD.findall(text.lower())]
+        features.extend(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        return [(feature, 1.0) for feature in set(features)]
+
+
+class RelevanceGate:
+    """Decides whether a window is worth a get_alpha call
+
+    In ``shadow`` mode nothing is skipped, but would-be skips are counted so
+    the LLM-call reduction can be measured before switching to ``enforce``.
+    """
+
+    def __init__(self, model: RelevanceModel, threshold: float = DEFAULT_THRESHOLD, mode: str = SHADOW):
+        if mode not in (OFF, SHADOW, ENFORCE):
+            raise ValueError(f"Unknown relevance gate mode: {mode}")
+        self.model = model
+        self.threshold = threshold
+        self.mode = mode
+        self.windows = 0
+        self.below_threshold = 0
+        self.skipped = 0
+
+    def check(self, texts: List[Optional[str]]) -> Tuple[float, bool]:
+        """Return (score, skip) for a window's new messages"""
+        score = self.model.score("\n".join(text for text in texts if text))
+        if self.mode == OFF:
+            return score, False
+        self.windows += 1
+        below = score < self.threshold
+        if below:
+            self.below_threshold += 1
+        skip = below and self.mode == ENFORCE
+        if skip:
+            self.skipped += 1
+        return score, skip
+
+    def metrics(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "windows": self.windows,
+            "below_threshold": self.below_threshold,
+            "skipped": self.skipped,
+            "llm_call_reduction": (
+                self.below_threshold / self.windows if self.windows else 0.0
+            ),
+        }
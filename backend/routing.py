@@ -0,0 +1,61 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+RouteKey = Tuple[int, Optional[int]]
+
+
+class WatchIndex:
+    """In-process routing table of watch entries keyed by (chat_id, topic_id)
+
+    Each key maps user_id -> watch entry, so routing an incoming message is a
+    dict lookup instead of a round trip to the watched_groups collection.
+    """
+
+    def __init__(self):
+        self.routes: Dict[RouteKey, Dict[str, dict]] = {}
+
+    def load(self, watch_entries: Iterable[dict]):
+        self.routes.clear()
+        for entry in watch_entries:
+            self.add(entry)
+
+    def add(self, watch_entry: dict):
+        key = (watch_entry["group_id"], watch_entry.get("topic_id"))
+        self.routes.setdefault(key, {})[watch_entry["user_id"]] = watch_entry
+
+    def remove(self, user_id: str, group_id: int, topic_id: Optional[int]) -> Optional[dict]:
+        key = (group_id, topic_id)
+        subscribers = self.routes.get(key)
+        if not subscribers:
+            return None
+        entry = subscribers.pop(user_id, None)
+        if not subscribers:
+            del self.routes[key]
+        return entry
+
+    def lookup(self, user_id: str, group_id: int, topic_id: Optional[int]) -> Optional[dict]:
+        """Return the most specific entry for a message: its topic, else the whole group
+
+        A message is routed once per user even when both its topic and its group
+        are watched.
+        """
+        if topic_id is not None:
+            entry = self.routes.get((group_id, topic_id), {}).get(user_id)
+            if entry:
+                return entry
+        return self.routes.get((group_id, None), {}).get(user_id)
+
+    def watches_chat(self, user_id: str, group_id: int) -> bool:
+        return any(
+            user_id in subscribers
+            for (chat_id, _), subscribers in self.routes.items()
+            if chat_id == group_id
+        )
+
+    def entries(self, user_id: Optional[str] = None) -> List[dict]:
+        return [
+            entry
+            for subscribers in self.routes.values()
+            for subscriber, entry in subscribers.items()
+            if user_id is None or subscriber == user_id
+        ]
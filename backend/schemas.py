@@ -0,0 +1,46 @@
+from typing import Annotated, Any, Dict, List, Literal
+
+from pydantic import BaseModel, BeforeValidator, ValidationError
+from pydantic_core import from_json
+
+
+def lower_sentiment(value: Any) -> Any:
+    return value.lower() if isinstance(value, str) else value
+
+
+# Models often answer "Positive"; both schemas accept it the same way
+Sentiment = Annotated[Literal["positive", "negative"], BeforeValidator(lower_sentiment)]
+
+
+class Alpha(BaseModel):
+    token: str
+    texts: List[str] = []
+    sentiment: Sentiment
+    confidence: float = 0.5
+
+
+class TweetsResponse(BaseModel):
+    tweets: List[str]
+
+
+class SentimentResponse(BaseModel):
+    sentiment: Sentiment
+
+
+def validate_alphas(items: Any) -> List[Dict]:
+    """Typed alpha dicts; malformed items are dropped instead of failing the window"""
+    if not isinstance(items, list):
+        return []
+    alphas = []
+    for item in items:
+        try:
+            alphas.append(Alpha.model_validate(item).model_dump())
+        except ValidationError as e:
+            print(f"Dropping malformed alpha {item}: {e.errors()[0]['msg']}")
+    return alphas
+
+
+def parse_alphas(response: str) -> List[Dict]:
+    """Parse a structured-mode {"tokens": [...]} reply"""
+    data = from_json(response)
+    return validate_alphas(data.get("tokens") if isinstance(data, dict) else data)
@@ -0,0 +1,128 @@
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from hashed_model import WORD, HashedLogisticModel
+
+
+NEGATIONS = {"not", "no", "never", "dont", "don't", "isnt", "isn't", "nahi", "mat"}
+
+# Seed lexicon (English, crypto slang and common Hinglish) so the local model is
+# usable before it has been trained on labelled tweets
+LEXICON = {
+    "bullish": 2.0, "moon": 1.5, "mooning": 1.8, "pump": 1.0, "pumping": 1.2,
+    "gem": 1.5, "buy": 0.8, "buying": 1.0, "long": 0.6, "ath": 1.2, "breakout": 1.5,
+    "rally": 1.5, "green": 1.0, "up": 0.5, "gains": 1.2, "profit": 1.0, "strong": 1.0,
+    "love": 1.2, "great": 1.2, "good": 1.0, "amazing": 1.5, "undervalued": 1.5,
+    "hodl": 0.8, "wagmi": 1.2, "lfg": 1.5, "send": 0.6, "accha": 1.0, "badhiya": 1.2,
+    "mast": 1.0, "🚀": 1.5, "🔥": 1.0, "💎": 1.0, "📈": 1.5, "💰": 0.8,
+    "bearish": -2.0, "dump": -1.5, "dumping": -1.8, "rug": -2.5, "rugged": -2.5,
+    "scam": -2.5, "sell": -0.8, "selling": -1.0, "short": -0.6, "crash": -2.0,
+    "red": -1.0, "down": -0.5, "loss": -1.2, "rekt": -2.0, "dead": -1.8, "weak": -1.0,
+    "hate": -1.2, "bad": -1.0, "terrible": -1.5, "overvalued": -1.5, "fud": -0.8,
+    "ngmi": -1.2, "exit": -0.8, "bekar": -1.2, "ghatiya": -1.5, "barbaad": -1.8,
+    "📉": -1.5, "💀": -1.2, "🤡": -1.0,
+}
+
+
+class SentimentModel(HashedLogisticModel):
+    """Lexicon-seeded model over hashed unigrams/bigrams"""
+
+    SEED_WEIGHTS = LEXICON
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        """(feature, sign) pairs; a negation flips the word that follows it"""
+        words = WORD.findall(text.lower())
+        features = []
+        sign = 1.0
+        for word in words:
+            if word in NEGATIONS:
+                sign = -1.0
+                continue
+            features.append((word, sign))
+            sign = 1.0
+        features.extend((f"{a} {b}", 1.0) for a, b in zip(words, words[1:]))
+        return features
+
+
+class SentimentBackend(ABC):
+    """Decides whether a batch of tweets about a token is positive or negative"""
+
+    name = "base"
+
+    @abstractmethod
+    async def analyse(self, tweets: List[str], token: str) -> Dict:
+        """Return {"sentiment": "positive"|"negative", "confidence": 0-1, "backend": name}"""
+
+    def metrics(self) -> Dict:
+        return {"backend": self.name}
+
+
+class LLMSentimentBackend(SentimentBackend):
+    """Asks the LLM, via the existing analyse_tweets prompt"""
+
+    name = "llm"
+
+    def __init__(self, analyse_tweets: Callable[[List[str], str], Awaitable[Dict]]):
+        self._analyse_tweets = analyse_tweets
+        self.calls = 0
+
+    async def analyse(self, tweets: List[str], token: str) -> Dict:
+        self.calls += 1
+        result = await self._analyse_tweets(tweets, token)
+        return {"sentiment": result["sentiment"], "confidence": 1.0, "backend": self.name}
+
+    def metrics(self) -> Dict:
+        return {"backend": self.name, "calls": self.calls}
+
+
+class LocalSentimentBackend(SentimentBackend):
+    """Runs a SentimentModel on the CPU, escalating unsure calls
+
+    All tweets of a call are scored in one vectorised pass. If the averaged
+    probability is not confidently positive or negative, the call escalates
+    to ``fallback`` (normally the LLM backend).
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        fallback: Optional[SentimentBackend] = None,
+        min_confidence: float = 0.4,
+        model: Optional[SentimentModel] = None,
+    ):
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self.model = model if model is not None else SentimentModel()
+        self.local = 0
+        self.escalated = 0
+
+    def save(self, path: str):
+        self.model.save(path)
+
+    def load(self, path: str):
+        self.model = SentimentModel.load(path)
+
+    async def analyse(self, tweets: List[str], token: str) -> Dict:
+        probability = float(self.model.predict(tweets).mean()) if tweets else 0.5
+        confidence = abs(probability - 0.5) * 2
+        if confidence < self.min_confidence and self.fallback is not None:
+            self.escalated += 1
+            return await self.fallback.analyse(tweets, token)
+        self.local += 1
+        return {
+            "sentiment": "positive" if probability >= 0.5 else "negative",
+            "confidence": confidence,
+            "backend": self.name,
+        }
+
+    def metrics(self) -> Dict:
+        total = self.local + self.escalated
+        return {
+            "backend": self.name,
+            "min_confidence": self.min_confidence,
+            "local": self.local,
+            "escalated": self.escalated,
+            "escalation_rate": self.escalated / total if total else 0.0,
+            "fallback": self.fallback.metrics() if self.fallback else None,
+        }
@@ -1,21 +1,42 @@
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 import os
 import asyncio
 import random
+import time
 from aptos.aptos import generate_account
 from aptos.pythonutil import store_keys, request_access, get_encrypted_keys
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from groq import Groq
 from pydantic import BaseModel
 from motor.motor_asyncio import AsyncIOMotorClient
-from telethon import TelegramClient, events, functions
+from telethon import TelegramClient, types
 from telethon.sessions import StringSession
-from typing import Dict, List, Any, Tuple
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
 from pydantic_core import from_json
 from web3util import edu_balance, token_balance, buy_token, sell_token
+from connections import ConnectionManager, SessionExpired, UserConnection
+from telegram_scheduler import DEFAULT_RATES
+from routing import WatchIndex
+from ingest import IngestQueue, IngestRecord
+from windows import ConversationWindows, FlushPolicy, WindowSnapshot
+from flush_scheduler import FlushScheduler
+from message_log import MessageLog
+from bootstrap import BootJob, Bootstrapper
+from vault import CredentialVault, Credentials
+from dialogs import DialogIndexCache, fetch_forum_topics
+from relevance import DEFAULT_THRESHOLD, OFF, RelevanceGate, RelevanceModel
+from dedup import DedupIndex
+from llm import LLMGateway
+from llm_admission import LLMAdmission
+from llm_cache import DEFAULT_TTLS, ResponseCache
+from batcher import MicroBatcher
+from json_stream import iter_array_items
+from sentiment import LLMSentimentBackend, LocalSentimentBackend
+from cascade import ModelCascade
+from prompt_compaction import compact_window
+from schemas import SentimentResponse, TweetsResponse, parse_alphas, validate_alphas
 
 load_dotenv()
 
@@ -32,22 +53,189 @@ app.add_middleware(
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME")
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
+# Comma-separated, newest first; older keys only decrypt until rotation finishes
+ENCRYPTION_KEYS = os.getenv("ENCRYPTION_KEYS", ENCRYPTION_KEY).split(",")
 API_ID = int(os.getenv("API_ID"))
 API_HASH = os.getenv("API_HASH")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "users")
-fernet = Fernet(ENCRYPTION_KEY)
 
 client = AsyncIOMotorClient(MONGO_URI)
 db = client[DB_NAME]
 
 WATCHED_GROUPS_COLLECTION = "watched_groups"
 
-active_watchers = {}
+vault = CredentialVault(
+    db[COLLECTION_NAME],
+    ENCRYPTION_KEYS,
+    maxsize=int(os.getenv("CREDENTIAL_CACHE_SIZE", "1024")),
+)
+
+watch_index = WatchIndex()
+
+connections = ConnectionManager(
+    on_group_message=lambda *args: handle_group_message(*args),
+    on_private_message=lambda *args: handle_private_message(*args),
+    sender_cache_size=int(os.getenv("SENDER_CACHE_SIZE", "4096")),
+    sender_cache_ttl=float(os.getenv("SENDER_CACHE_TTL", "3600")),
+    scheduler_rates={
+        method_class: float(os.getenv(f"TG_RATE_{method_class.upper()}", rate))
+        for method_class, rate in DEFAULT_RATES.items()
+    },
+    on_reconnect=lambda connection: resume_watchers(connection),
+    backoff_base=float(os.getenv("RECONNECT_BACKOFF_BASE", "2")),
+    backoff_max=float(os.getenv("RECONNECT_BACKOFF_MAX", "300")),
+)
+BULK_SEND_CONCURRENCY = int(os.getenv("BULK_SEND_CONCURRENCY", "10"))
+
+# Hard cap on the estimated tokens of each window rendered into a get_alpha prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+PROMPT_MESSAGE_CHARS = int(os.getenv("PROMPT_MESSAGE_CHARS", "400"))
+# Prompt room kept for the group header, so a flushed window's new messages always fit
+PROMPT_HEADER_TOKENS = 64
+
+
+def clamp_flush_policy(policy: FlushPolicy) -> FlushPolicy:
+    """Cap the token trigger so compact_window never cuts messages that were not analysed"""
+    return policy._replace(
+        max_tokens=min(policy.max_tokens, PROMPT_TOKEN_BUDGET - PROMPT_HEADER_TOKENS)
+    )
+
+
+windows = ConversationWindows(
+    overlap=int(os.getenv("WINDOW_OVERLAP", "3")),
+    default_policy=clamp_flush_policy(
+        FlushPolicy(
+            max_messages=int(os.getenv("FLUSH_MAX_MESSAGES", "8")),
+            max_age=float(os.getenv("FLUSH_MAX_AGE", "60")),
+            max_tokens=int(os.getenv("FLUSH_MAX_TOKENS", "1000")),
+        )
+    ),
+)
+
+flush_scheduler = FlushScheduler(
+    windows,
+    on_flush=lambda snapshot: analyse_window(snapshot),
+    tick=float(os.getenv("FLUSH_TICK", "1")),
+)
+
+ingest_queue = IngestQueue(
+    handler=lambda record: process_message(record),
+    maxsize=int(os.getenv("INGEST_QUEUE_SIZE", "1000")),
+    workers=int(os.getenv("INGEST_WORKERS", "4")),
+    drop_policy=os.getenv("INGEST_DROP_POLICY", "drop_oldest"),
+)
+
+message_log = MessageLog(
+    os.getenv("MESSAGE_LOG_DIR", "message_log"),
+    segment_size=int(os.getenv("MESSAGE_LOG_SEGMENT_BYTES", str(8 * 1024 * 1024))),
+    max_segments=int(os.getenv("MESSAGE_LOG_MAX_SEGMENTS", "16")),
+)
+CATCHUP_PAGE_SIZE = int(os.getenv("CATCHUP_PAGE_SIZE", "500"))
+CATCHUP_BACKOFF_BASE = float(os.getenv("CATCHUP_BACKOFF_BASE", "2"))
+CATCHUP_BACKOFF_MAX = float(os.getenv("CATCHUP_BACKOFF_MAX", "300"))
+
+# (user_id, group_id) -> live messages held back while that chat catches up
+catchup_buffers: Dict[Tuple[str, int], list] = {}
+
+bootstrapper = Bootstrapper(
+    concurrency=int(os.getenv("STARTUP_CONCURRENCY", "10")),
+    per_dc=int(os.getenv("STARTUP_PER_DC", "3")),
+)
+# Users active within this many days are started before the app accepts requests
+STARTUP_RECENT_DAYS = float(os.getenv("STARTUP_RECENT_DAYS", "7"))
+
+dialog_indexes = DialogIndexCache(
+    ttl=float(os.getenv("DIALOG_CACHE_TTL", "300")),
+    topic_concurrency=int(os.getenv("DIALOG_TOPIC_CONCURRENCY", "5")),
+)
+
+relevance_gate = RelevanceGate(
+    RelevanceModel.load(os.getenv("RELEVANCE_WEIGHTS"))
+    if os.getenv("RELEVANCE_WEIGHTS")
+    else RelevanceModel(),
+    threshold=float(os.getenv("RELEVANCE_THRESHOLD", DEFAULT_THRESHOLD)),
+    mode=os.getenv("RELEVANCE_MODE", "shadow"),
+)
 
-queue = {}
+# Shared by every watcher so a shill cross-posted to many groups is analysed once per user
+dedup_index = DedupIndex(
+    horizon=float(os.getenv("DEDUP_HORIZON", "3600")),
+    max_distance=int(os.getenv("DEDUP_MAX_DISTANCE", "3")),
+    min_words=int(os.getenv("DEDUP_MIN_WORDS", "6")),
+)
+
+llm = LLMGateway(
+    api_key=os.getenv("GROQ_API_KEY"),
+    model=os.getenv("GROQ_MODEL"),
+    timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+    retries=int(os.getenv("LLM_RETRIES", "3")),
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+    cache=ResponseCache(
+        os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"),
+        maxsize=int(os.getenv("LLM_CACHE_SIZE", "2048")),
+        ttls={
+            kind: float(os.getenv(f"LLM_CACHE_TTL_{kind.upper()}", ttl))
+            for kind, ttl in DEFAULT_TTLS.items()
+        },
+    )
+    if os.getenv("LLM_CACHE", "true").lower() == "true"
+    else None,
+    bypass_cache=os.getenv("LLM_CACHE_BYPASS", "false").lower() == "true",
+    # JSON response format and per-kind caps on the answer itself
+    structured=os.getenv("LLM_STRUCTURED_OUTPUT", "false").lower() == "true",
+    max_tokens={
+        kind: int(os.getenv(f"LLM_MAX_TOKENS_{kind.upper()}", default))
+        for kind, default in (("alpha", "1024"), ("tweets", "1536"), ("sentiment", "64"))
+    },
+    # Only models matching these prefixes get reasoning options and extra room to think
+    reasoning_models=[
+        prefix
+        for prefix in os.getenv("LLM_REASONING_MODELS", "qwen/qwen3,deepseek-r1").split(",")
+        if prefix
+    ],
+    reasoning_tokens=int(os.getenv("LLM_REASONING_TOKENS", "2048")),
+    reasoning_format=os.getenv("LLM_REASONING_FORMAT", "hidden") or None,
+    reasoning_effort=os.getenv("LLM_REASONING_EFFORT") or None,
+    admission=LLMAdmission(
+        rpm=float(os.getenv("LLM_RPM", "30")),
+        tpm=float(os.getenv("LLM_TPM", "6000")),
+        output_tokens=int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "1024")),
+    ),
+)
+
+# get_alpha runs on GROQ_FAST_MODEL first; unsure windows are re-run on GROQ_MODEL
+cascade = ModelCascade(
+    fast_model=os.getenv("GROQ_FAST_MODEL"),
+    strong_model=os.getenv("GROQ_MODEL"),
+    threshold=float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "0.7")),
+)
+
+# Streams get_alpha per window instead of batching, trading tokens for time-to-first-decision
+ALPHA_STREAMING = os.getenv("ALPHA_STREAMING", "false").lower() == "true"
+
+alpha_batcher = MicroBatcher(
+    handler=lambda queues: get_alpha_batch(queues),
+    max_wait=float(os.getenv("ALPHA_BATCH_WAIT", "0.3")),
+    max_size=int(os.getenv("ALPHA_BATCH_SIZE", "8")),
+)
+
+llm_sentiment = LLMSentimentBackend(lambda tweets, token: analyse_tweets(tweets, token))
+if os.getenv("SENTIMENT_BACKEND", "local") == "local":
+    # Answers confident cases on the CPU and escalates the rest to the LLM
+    sentiment_backend = LocalSentimentBackend(
+        fallback=llm_sentiment,
+        min_confidence=float(os.getenv("SENTIMENT_MIN_CONFIDENCE", "0.4")),
+    )
+    if os.getenv("SENTIMENT_WEIGHTS"):
+        sentiment_backend.load(os.getenv("SENTIMENT_WEIGHTS"))
+else:
+    sentiment_backend = llm_sentiment
+
+# Bounds how many alphas are validated at once across all windows
+token_semaphore = asyncio.Semaphore(int(os.getenv("TOKEN_CONCURRENCY", "5")))
+transaction_locks: Dict[str, asyncio.Lock] = {}
 
 temp_clients: Dict[str, dict] = {}
-message_listener_clients: Dict[str, TelegramClient] = {}
 
 
 class UserInitRequest(BaseModel):
@@ -60,6 +248,9 @@ class WatchGroupRequest(BaseModel):
     group_name: str
     topic_name: str = None
     webhook_url: str = None
+    flush_max_messages: int = None
+    flush_max_age: float = None
+    flush_max_tokens: int = None
 
 
 class VerifyOTPRequest(BaseModel):
@@ -72,12 +263,19 @@ class SendMessageRequest(BaseModel):
     message: str
 
 
+class BulkSendMessageRequest(BaseModel):
+    messages: List[SendMessageRequest]
+
+
 def encrypt_data(data: str) -> str:
-    return fernet.encrypt(data.encode()).decode()
+    return vault.encrypt(data)
 
 
-def decrypt_data(encrypted_data: str) -> str:
-    return fernet.decrypt(encrypted_data.encode()).decode()
+async def get_credentials(user_id: str) -> Credentials:
+    credentials = await vault.get(user_id)
+    if not credentials:
+        raise HTTPException(status_code=404, detail="User not registered")
+    return credentials
 
 
 def generate_reply(message_text: str) -> str:
@@ -85,99 +283,126 @@ def generate_reply(message_text: str) -> str:
     return f"Thanks for your message: {message_text}"
 
 
+async def handle_private_message(user_id: str, event):
+    """Answer incoming private messages on the user's shared connection"""
+    reply = generate_reply(event.message.text)
+    connection = connections.get(user_id)
+    await connection.scheduler.call("send", event.reply, reply)
+
+
 async def init_message_listener(
     user_id: str, api_id: int, api_hash: str, session_string: str
 ):
-    """Initialize and start a message listener for a user"""
+    """Connect the user's shared client, which also listens for private messages"""
     try:
-        session = StringSession(session_string)
-        client = TelegramClient(session, api_id, api_hash)
+        await connections.connect(user_id, api_id, api_hash, session_string)
+    except Exception as e:
+        print(f"Error initializing listener for {user_id}: {str(e)}")
 
-        await client.connect()
-        if not await client.is_user_authorized():
-            await client.disconnect()
-            return
 
-        @client.on(events.NewMessage(incoming=True))
-        async def handler(event):
-            if not event.is_private:
-                return
-            reply = generate_reply(event.message.text)
-            await event.reply(reply)
+async def get_user_connection(user_id: str) -> UserConnection:
+    """Return the user's long-lived connection, connecting it on first use"""
+    connection = connections.get(user_id)
+    if connection:
+        return connection
 
-        asyncio.create_task(client.run_until_disconnected())
-        message_listener_clients[user_id] = client
-    except Exception as e:
-        print(f"Error initializing listener for {user_id}: {str(e)}")
+    credentials = await get_credentials(user_id)
+    try:
+        return await connections.connect(
+            user_id,
+            credentials.api_id,
+            credentials.api_hash,
+            credentials.session_string,
+        )
+    except SessionExpired:
+        raise HTTPException(status_code=401, detail="Session expired")
 
 
-async def get_user_client(user_id: str) -> TelegramClient:
-    user = await db[COLLECTION_NAME].find_one({"user_id": user_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not registered")
+def get_last_active(user: dict) -> Optional[datetime]:
+    """When the user's windows were last analysed (Mongo returns naive UTC datetimes)"""
+    last_active = user.get("last_active")
+    return last_active.replace(tzinfo=UTC) if last_active else None
 
-    session = decrypt_data(user["session_string"])
-    client = TelegramClient(
-        StringSession(session), user["api_id"], decrypt_data(user["api_hash"])
-    )
 
-    if not client.is_connected():
-        await client.connect()
-        if not await client.is_user_authorized():
-            raise HTTPException(status_code=401, detail="Session expired")
+def make_boot_job(user: dict, watch_entries: List[dict]) -> BootJob:
+    credentials = vault.load(user)
+
+    async def start():
+        await connections.connect(
+            credentials.user_id,
+            credentials.api_id,
+            credentials.api_hash,
+            credentials.session_string,
+        )
+        for entry in watch_entries:
+            await start_group_watcher(entry)
 
-    return client
+    dc_id = StringSession(credentials.session_string).dc_id
+    return BootJob(credentials.user_id, dc_id, start)
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Start message listeners for all existing users on startup"""
+    """Start user connections and group watchers on startup"""
     print("Starting application...")
+    started_at = time.monotonic()
+    ingest_queue.start()
+    flush_scheduler.start()
+    asyncio.create_task(replay_message_log())
+    if vault.rotating:
+        asyncio.create_task(vault.rotate())
 
-    print("Initializing message listeners for existing users...")
-    async for user in db[COLLECTION_NAME].find():
-        try:
-            print(f"Setting up listener for user {user['user_id']}")
-            api_id = user["api_id"]
-            api_hash = decrypt_data(user["api_hash"])
-            session_string = decrypt_data(user["session_string"])
-            await init_message_listener(
-                user["user_id"], api_id, api_hash, session_string
-            )
-        except Exception as e:
-            print(f"Failed to initialize listener for {user['user_id']}: {str(e)}")
-
-    print("Initializing group watchers...")
     try:
-        cursor = db[WATCHED_GROUPS_COLLECTION].find({})
-        watch_entries = await cursor.to_list(None)
+        watch_entries = await db[WATCHED_GROUPS_COLLECTION].find({}).to_list(None)
         print(f"Found {len(watch_entries)} watch entries to initialize")
+        watch_index.load(watch_entries)
 
-        for entry in watch_entries:
-            try:
-                print(
-                    f"Starting watcher for group {entry['group_name']} (ID: {entry['group_id']})"
-                )
-                await start_group_watcher(
-                    entry["user_id"], entry["group_id"], entry.get("topic_id")
-                )
-            except Exception as e:
-                print(f"Failed to start watcher for {entry['group_name']}: {str(e)}")
-
+        users = await db[COLLECTION_NAME].find().to_list(None)
     except Exception as e:
-        print(f"Error restarting watchers: {str(e)}")
+        print(f"Error loading users and watchers: {str(e)}")
+        return
+
+    # Most recently active users come up first; idle ones start in the background
+    oldest = datetime.min.replace(tzinfo=UTC)
+    users.sort(key=lambda user: get_last_active(user) or oldest, reverse=True)
+    recent_cutoff = datetime.now(UTC) - timedelta(days=STARTUP_RECENT_DAYS)
+
+    eager, lazy = [], []
+    for user in users:
+        try:
+            entries = watch_index.entries(user["user_id"])
+            job = make_boot_job(user, entries)
+        except Exception as e:
+            print(f"Failed to prepare startup for {user['user_id']}: {str(e)}")
+            continue
+        last = get_last_active(user)
+        if last and last >= recent_cutoff:
+            eager.append(job)
+        else:
+            lazy.append(job)
 
+    print(f"Starting {len(eager)} recently active users, {len(lazy)} in background")
+    await bootstrapper.run(eager, phase="recent")
+    if lazy:
+        asyncio.create_task(bootstrapper.run(lazy, phase="background"))
+
+    bootstrapper.phases["startup_event"] = time.monotonic() - started_at
     print("Startup process completed")
 
 
+@app.get("/startup-status")
+async def get_startup_status():
+    return bootstrapper.status()
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Disconnect all message listeners on shutdown"""
-    for client in message_listener_clients.values():
-        await client.disconnect()
-
-    for task in active_watchers.values():
-        task.cancel()
+    """Disconnect all user connections on shutdown"""
+    await connections.disconnect_all()
+    await ingest_queue.stop()
+    message_log.close()
+    await flush_scheduler.stop()
+    await llm.close()
 
 
 @app.post("/init")
@@ -205,61 +430,41 @@ async def initialize_user(request: UserInitRequest):
 async def watch_group(request: WatchGroupRequest):
     """Add a group/channel to watch list"""
     try:
-        user = await db[COLLECTION_NAME].find_one({"user_id": request.user_id})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not registered")
-
-        session = decrypt_data(user["session_string"])
-        client = TelegramClient(
-            StringSession(session), user["api_id"], decrypt_data(user["api_hash"])
-        )
-
-        await client.connect()
-        if not await client.is_user_authorized():
-            await client.disconnect()
-            raise HTTPException(status_code=401, detail="Session expired")
+        connection = await get_user_connection(request.user_id)
+        client = connection.client
 
         found_entity = None
         found_topic_id = None
 
-        try:
-            found_entity = await client.get_entity(request.group_name)
-        except:
-            dialogs = await client.get_dialogs()
-            for dialog in dialogs:
-                if dialog.title.lower() == request.group_name.lower() or (
-                    hasattr(dialog.entity, "username")
-                    and dialog.entity.username
-                    and dialog.entity.username.lower() == request.group_name.lower()
-                ):
-                    found_entity = dialog.entity
-                    break
+        dialog_index = await dialog_indexes.get(request.user_id, connection)
+        found_entity = dialog_index.find(request.group_name)
+        if not found_entity:
+            try:
+                found_entity = await connection.scheduler.call(
+                    "resolve", client.get_entity, request.group_name
+                )
+            except:
+                dialog_index = await dialog_indexes.get(
+                    request.user_id, connection, refresh=True
+                )
+                found_entity = dialog_index.find(request.group_name)
 
         if not found_entity:
-            await client.disconnect()
             raise HTTPException(
                 status_code=404,
                 detail=f"Group/channel '{request.group_name}' not found",
             )
 
         if request.topic_name and getattr(found_entity, "forum", False):
-            topics = await client(
-                functions.channels.GetForumTopicsRequest(
-                    channel=found_entity,
-                    offset_date=0,
-                    offset_id=0,
-                    offset_topic=0,
-                    limit=100,
+            topic = dialog_index.find_topic(found_entity.id, request.topic_name)
+            if not topic:
+                dialog_index.topics[found_entity.id] = await fetch_forum_topics(
+                    connection, found_entity
                 )
-            )
-
-            for topic in topics.topics:
-                if topic.title.lower() == request.topic_name.lower():
-                    found_topic_id = topic.id
-                    break
+                topic = dialog_index.find_topic(found_entity.id, request.topic_name)
+            found_topic_id = topic["id"] if topic else None
 
             if not found_topic_id:
-                await client.disconnect()
                 raise HTTPException(
                     status_code=404,
                     detail=f"Topic '{request.topic_name}' not found in the forum",
@@ -274,6 +479,7 @@ async def watch_group(request: WatchGroupRequest):
             "topic_id": found_topic_id,
             "topic_name": request.topic_name if found_topic_id else None,
             "webhook_url": request.webhook_url,
+            "flush_policy": get_flush_policy(request),
             "created_at": datetime.now(),
             "username": getattr(found_entity, "username", None),
         }
@@ -288,10 +494,7 @@ async def watch_group(request: WatchGroupRequest):
             upsert=True,
         )
 
-        if request.webhook_url:
-            await start_group_watcher(request.user_id, found_entity.id, found_topic_id)
-
-        await client.disconnect()
+        await start_group_watcher(watch_entry)
 
         return {
             "status": "success",
@@ -303,6 +506,19 @@ async def watch_group(request: WatchGroupRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def get_flush_policy(request: WatchGroupRequest) -> Optional[Dict]:
+    """Per-group flush overrides, or None to use the defaults"""
+    overrides = {
+        "max_messages": request.flush_max_messages,
+        "max_age": request.flush_max_age,
+        "max_tokens": request.flush_max_tokens,
+    }
+    overrides = {k: v for k, v in overrides.items() if v is not None}
+    if not overrides:
+        return None
+    return clamp_flush_policy(windows.default_policy._replace(**overrides))._asdict()
+
+
 @app.get("/watched-groups/{user_id}")
 async def get_watched_groups(user_id: str):
     """Get all watched groups for a user"""
@@ -322,15 +538,6 @@ async def get_watched_groups(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def get_topic_ids(user_id: str):
-    cursor = db[WATCHED_GROUPS_COLLECTION].find({"user_id": user_id})
-    watched_groups = await cursor.to_list(None)
-    return [
-        group["topic_id"] if group["topic_id"] is not None else group["group_id"]
-        for group in watched_groups
-    ]
-
-
 @app.delete("/unwatch-group")
 async def unwatch_group(user_id: str, group_id: int, topic_id: int = None):
     """Remove a group/channel from watch list"""
@@ -340,15 +547,12 @@ async def unwatch_group(user_id: str, group_id: int, topic_id: int = None):
         if topic_id is not None:
             filter_query["topic_id"] = topic_id
 
-        result = await db[WATCHED_GROUPS_COLLECTION].delete_one(filter_query)
+        deleted = await db[WATCHED_GROUPS_COLLECTION].find_one_and_delete(filter_query)
 
-        if result.deleted_count == 0:
+        if not deleted:
             raise HTTPException(status_code=404, detail="Watched group/topic not found")
 
-        watcher_key = f"{user_id}:{group_id}:{topic_id}"
-        if watcher_key in active_watchers:
-            active_watchers[watcher_key].cancel()
-            del active_watchers[watcher_key]
+        stop_group_watcher(user_id, group_id, deleted.get("topic_id"))
 
         return {"status": "success", "message": "Stopped watching group/topic"}
 
@@ -356,203 +560,298 @@ async def unwatch_group(user_id: str, group_id: int, topic_id: int = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def start_group_watcher(user_id, group_id, topic_id=None):
-    """Start a background task to watch a group/channel for messages"""
-    watcher_key = f"{user_id}:{group_id}:{topic_id}"
-    print(f"Starting group watcher with key: {watcher_key}")
+async def start_group_watcher(watch_entry: dict):
+    """Index a watch entry and route its chat on the user's shared connection"""
+    user_id = watch_entry["user_id"]
+    group_id = watch_entry["group_id"]
+    topic_id = watch_entry.get("topic_id")
+    print(f"Starting group watcher with key: {user_id}:{group_id}:{topic_id}")
+
+    watch_index.add(watch_entry)
+    flush_policy = watch_entry.get("flush_policy")
+    windows.set_policy(
+        (user_id, group_id, topic_id),
+        clamp_flush_policy(FlushPolicy(**flush_policy)) if flush_policy else None,
+    )
+    connection = await get_user_connection(user_id)
+    if group_id not in connection.chats:
+        connection.add_chat(group_id)
+        schedule_catch_up(connection, group_id)
+
+    return connection
 
-    if watcher_key in active_watchers:
-        print(f"Cancelling existing watcher for {watcher_key}")
-        active_watchers[watcher_key].cancel()
-        del active_watchers[watcher_key]
 
-    print(f"Creating new watcher task for {watcher_key}")
-    task = asyncio.create_task(watch_group_messages(user_id, group_id, topic_id))
-    active_watchers[watcher_key] = task
-    print(f"Watcher task created and stored for {watcher_key}")
+def schedule_catch_up(connection: UserConnection, group_id: int):
+    key = (connection.user_id, group_id)
+    if key in catchup_buffers or not message_log.last_message_id(*key):
+        return
+    # Buffer live messages until the missed ones have been ingested
+    catchup_buffers[key] = []
+    asyncio.create_task(catch_up(connection.user_id, group_id))
 
-    return task
 
+async def resume_watchers(connection: UserConnection):
+    """After a reconnect, fetch whatever every watched chat missed while down"""
+    print(f"Connection for {connection.user_id} is back, catching up watched chats")
+    for group_id in list(connection.chats):
+        schedule_catch_up(connection, group_id)
 
-async def watch_group_messages(user_id, group_id, topic_id=None):
-    """Background task to watch for messages in a group/channel"""
-    try:
-        print(
-            f"Starting watch_group_messages for user {user_id}, group {group_id}, topic {topic_id}"
-        )
 
-        user = await db[COLLECTION_NAME].find_one({"user_id": user_id})
-        if not user:
-            print(f"User {user_id} not found for watcher")
-            return
+def stop_group_watcher(user_id, group_id, topic_id=None):
+    """Drop a watcher, removing its chat from routing once no topic needs it"""
+    watch_index.remove(user_id, group_id, topic_id)
+
+    if watch_index.watches_chat(user_id, group_id):
+        return
 
-        print(f"Found user {user_id} in database")
+    connection = connections.get(user_id)
+    if connection:
+        connection.remove_chat(group_id)
 
-        watch_entry = await db[WATCHED_GROUPS_COLLECTION].find_one(
-            {"user_id": user_id, "group_id": group_id, "topic_id": topic_id}
-        )
 
-        if not watch_entry:
-            print(f"Watch entry not found for {user_id}:{group_id}:{topic_id}")
+def get_message_topic_id(message) -> Optional[int]:
+    reply_to = getattr(message, "reply_to", None)
+    if reply_to is None or not getattr(reply_to, "forum_topic", False):
+        return None
+    return reply_to.reply_to_top_id or reply_to.reply_to_msg_id
+
+
+async def handle_group_message(user_id: str, group_id: int, event):
+    """Handle a message from any chat watched on the user's shared connection"""
+    try:
+        connection = connections.get(user_id)
+        if connection:
+            connection.cache_senders(event)
+        buffered = catchup_buffers.get((user_id, group_id))
+        if buffered is not None:
+            buffered.append(event.message)
             return
+        await ingest_message(user_id, group_id, event.message)
 
-        print(f"Found watch entry for group {watch_entry['group_name']}")
-        print(f"Setting up client for user {user_id} to watch group {group_id}")
+    except Exception as e:
+        print(f"Error in message handler: {str(e)}")
 
-        session = decrypt_data(user["session_string"])
-        print("Decrypted session string")
 
-        client = TelegramClient(
-            StringSession(session), user["api_id"], decrypt_data(user["api_hash"])
-        )
-        print("Created TelegramClient instance")
+async def ingest_message(user_id: str, group_id: int, message):
+    """Log a watched message and hand it to the analysis workers"""
+    if message.id <= message_log.last_message_id(user_id, group_id):
+        return
 
-        print("Attempting to connect client...")
-        await client.connect()
-        print("Client connected")
+    topic_id = get_message_topic_id(message)
+    watch_entry = watch_index.lookup(user_id, group_id, topic_id)
+    if not watch_entry:
+        return
+
+    connection = connections.get(user_id)
+    if not connection:
+        return
+
+    sender_name = await connection.get_sender_name(message)
+    record = IngestRecord(
+        user_id=user_id,
+        group_id=group_id,
+        topic_id=watch_entry.get("topic_id"),
+        group_name=watch_entry["group_name"],
+        topic_name=watch_entry["topic_name"],
+        sender_name=sender_name,
+        message_text=message.text,
+        received_at=time.monotonic(),
+        message_id=message.id,
+    )
+    message_log.append(record)
+    connection.last_message_at[(group_id, record.topic_id)] = time.time()
+    await ingest_queue.put(record)
 
-        if not await client.is_user_authorized():
-            print(f"User {user_id} not authorized for watcher")
-            await client.disconnect()
-            return
 
-        print(f"Successfully connected client for user {user_id}")
-        print(
-            f"Starting watcher for {watch_entry['group_name']}{f' - {watch_entry['topic_name']}' if topic_id else ''}"
+async def resolve_group(connection: UserConnection, group_id: int):
+    """Resolve a bare group id to an entity, falling back to the dialog index"""
+    for peer in (types.PeerChannel(group_id), types.PeerChat(group_id)):
+        try:
+            return await connection.scheduler.call(
+                "resolve", connection.client.get_input_entity, peer
+            )
+        except (ValueError, TypeError):
+            continue
+    dialog_index = await dialog_indexes.get(connection.user_id, connection)
+    return dialog_index.entities.get(group_id)
+
+
+async def fetch_missed(connection: UserConnection, group_id: int) -> int:
+    """Page through history from the chat's watermark until the gap is closed"""
+    user_id = connection.user_id
+    peer = await resolve_group(connection, group_id)
+    if peer is None:
+        raise ValueError(f"Cannot resolve group {group_id}")
+
+    min_id = message_log.last_message_id(user_id, group_id)
+    count = 0
+    while True:
+        page = 0
+        messages = connection.client.iter_messages(
+            peer, min_id=min_id, reverse=True, limit=CATCHUP_PAGE_SIZE
         )
+        async for message in connection.scheduler.iterate("history", messages):
+            await ingest_message(user_id, group_id, message)
+            # Unwatched topics are skipped without moving the watermark
+            min_id = max(min_id, message.id)
+            page += 1
+        count += page
+        if page < CATCHUP_PAGE_SIZE:
+            return count
 
-        @client.on(events.NewMessage(chats=group_id))
-        async def handler(event):
-            print("DEBUG: New message event received!")
-            try:
-                if topic_id is not None:
-                    if (
-                        not hasattr(event.message, "reply_to")
-                        or event.message.reply_to is None
-                    ):
-                        print("DEBUG: Message has no reply_to attribute or is None")
-                        return
-                    if (
-                        not hasattr(event.message.reply_to, "forum_topic")
-                        or not event.message.reply_to.forum_topic
-                    ):
-                        print("DEBUG: Message is not in a forum topic")
-                        return
-                    topic_ids = await get_topic_ids(user_id)
-                    if event.message.reply_to.reply_to_msg_id not in topic_ids:
-                        print(
-                            f"DEBUG: Message topic ID {event.message.reply_to.reply_to_msg_id} doesn't match expected {topic_id}"
-                        )
-                        return
-
-                topicId = event.message.reply_to.reply_to_msg_id
-                watch_entry = await get_watch_entry(user_id, topicId)
-                sender = await event.get_sender()
-                first_name = getattr(sender, "first_name", "") or ""
-                last_name = getattr(sender, "last_name", "") or ""
-                sender_name = f"{first_name} {last_name}"
-                sender_name = sender_name.strip() or sender.username or "Unknown"
-                await process_message(
-                    watch_entry["group_name"],
-                    watch_entry["topic_name"],
-                    sender_name,
-                    event.message.text,
-                    user_id,
-                )
 
+async def catch_up(user_id: str, group_id: int):
+    """Ingest messages missed since the chat's watermark, then go live
+
+    Live messages stay buffered until the gap is closed, retrying with
+    backoff on failure, so the watermark never moves past a missed message.
+    """
+    key = (user_id, group_id)
+    attempt = 0
+    while watch_index.watches_chat(user_id, group_id):
+        # Looked up each attempt so a replaced connection is picked up
+        connection = connections.get(user_id)
+        try:
+            if connection is None:
+                raise ConnectionError("User is not connected")
+            count = await fetch_missed(connection, group_id)
+        except asyncio.CancelledError:
+            catchup_buffers.pop(key, None)
+            raise
+        except Exception as e:
+            delay = min(CATCHUP_BACKOFF_MAX, CATCHUP_BACKOFF_BASE * 2**attempt)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            attempt += 1
+            print(f"Error catching up {user_id}:{group_id}, retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+            continue
+
+        print(f"Caught up {count} messages for {user_id}:{group_id}")
+        # Drain in place so messages arriving meanwhile queue up behind these
+        buffered = catchup_buffers.get(key, [])
+        while buffered:
+            try:
+                await ingest_message(user_id, group_id, buffered.pop(0))
             except Exception as e:
                 print(f"Error in message handler: {str(e)}")
+        catchup_buffers.pop(key, None)
+        return
 
-        print("DEBUG: Event handler registered, starting to run client")
-        await client.run_until_disconnected()
+    catchup_buffers.pop(key, None)
 
-    except asyncio.CancelledError:
-        print(f"Watcher for {user_id}:{group_id}:{topic_id} cancelled")
-        if "client" in locals() and client.is_connected():
-            await client.disconnect()
 
-    except Exception as e:
-        print(f"Error in watcher {user_id}:{group_id}:{topic_id}: {str(e)}")
-        if "client" in locals() and client.is_connected():
-            await client.disconnect()
+async def replay_message_log():
+    """Re-ingest logged messages whose window was never analysed"""
+    count = 0
+    for record in message_log.uncommitted():
+        await ingest_queue.put_wait(record)
+        count += 1
+    print(f"Replayed {count} uncommitted messages from the message log")
 
 
-async def get_watch_entry(user_id: str, topic_id: int):
-    return await db[WATCHED_GROUPS_COLLECTION].find_one(
-        {"user_id": user_id, "topic_id": topic_id}
-    )
+@app.get("/watcher-health")
+async def get_watcher_health(user_id: str = None):
+    """State of every watcher's connection and the age of its last message"""
+    now = time.time()
+    watchers = []
+    for entry in watch_index.entries(user_id):
+        connection = connections.get_any(entry["user_id"])
+        key = (entry["group_id"], entry.get("topic_id"))
+        last_message_at = connection.last_message_at.get(key) if connection else None
+        watchers.append(
+            {
+                "user_id": entry["user_id"],
+                "group_id": entry["group_id"],
+                "topic_id": entry.get("topic_id"),
+                "group_name": entry["group_name"],
+                "topic_name": entry.get("topic_name"),
+                **(connection.health() if connection else {"state": "not_connected"}),
+                "catching_up": (entry["user_id"], entry["group_id"]) in catchup_buffers,
+                "last_message_age_seconds": (
+                    now - last_message_at if last_message_at else None
+                ),
+            }
+        )
+    return {"watchers": watchers}
+
+
+@app.post("/watcher-restart/{user_id}")
+async def restart_watchers(user_id: str):
+    """Force a fresh connection for a user and re-route all of their watched chats"""
+    await connections.disconnect(user_id)
+    vault.invalidate(user_id)
+    for entry in watch_index.entries(user_id):
+        await start_group_watcher(entry)
+    connection = await get_user_connection(user_id)
+    return {"status": "restarted", **connection.health()}
 
 
 @app.get("/get-queue")
 async def get_queue():
-    global queue
-    return queue
+    return windows.summary()
 
 
-async def process_message(
-    group_name: str, topic_name: str, sender_name: str, message_text: str, user_id: str
-):
-    global queue
-
-    queue[topic_name] = queue.get(topic_name, [])
-    queue[topic_name].append(
-        {
-            "group_name": group_name,
-            "topic_name": topic_name,
-            "sender_name": sender_name,
-            "message_text": message_text,
-            "user_id": user_id,
-            "overlap": False,
-        }
+@app.get("/ingest-metrics")
+async def get_ingest_metrics():
+    return {**ingest_queue.metrics(), "flush": flush_scheduler.metrics()}
+
+
+@app.get("/alpha-batch-metrics")
+async def get_alpha_batch_metrics():
+    return alpha_batcher.metrics()
+
+
+@app.get("/cascade-metrics")
+async def get_cascade_metrics():
+    return cascade.metrics()
+
+
+@app.get("/sentiment-metrics")
+async def get_sentiment_metrics():
+    return sentiment_backend.metrics()
+
+
+@app.get("/llm-admission-metrics")
+async def get_llm_admission_metrics():
+    return llm.admission.metrics()
+
+
+@app.get("/llm-cache-metrics")
+async def get_llm_cache_metrics():
+    return llm.cache_metrics()
+
+
+@app.get("/dedup-metrics")
+async def get_dedup_metrics():
+    return dedup_index.metrics()
+
+
+async def process_message(record: IngestRecord):
+    print("Message received:", record.message_text)
+    if dedup_index.check(record):
+        print(f"Suppressed near-duplicate in {record.group_name}")
+        return
+    await flush_scheduler.add(record)
+
+
+async def analyse_window(snapshot: WindowSnapshot):
+    user_id = snapshot.key[0]
+    await analyse_texts(snapshot, user_id)
+    message_log.commit(snapshot)
+    # Read back on startup to bring the most active users up first
+    await db[COLLECTION_NAME].update_one(
+        {"user_id": user_id}, {"$set": {"last_active": datetime.now(UTC)}}
     )
-    print("Message received:", message_text)
-    if len(queue[topic_name]) == 4:
-        last_10_messages = queue[topic_name]
-        queue[topic_name] = []
-        overlap_messages = last_10_messages[-3:]
-        for message in overlap_messages:
-            message["overlap"] = True
-            queue[topic_name].append(message)
-        await analyse_texts(last_10_messages, user_id)
-
-
-def generate(prompt: str):
-    max_retries = 3
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            client = Groq(
-                api_key=os.getenv("GROQ_API_KEY"),
-            )
-            response = client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                model=os.getenv("GROQ_MODEL"),
-                stream=False,
-            )
-            output = response.choices[0].message.content
-            output = output.split("</think>")[1]
-            return output
-            
-        except Exception as e:
-            retry_count += 1
-            if retry_count == max_retries:
-                raise Exception(f"Failed after {max_retries} retries: {str(e)}")
-            print(f"Attempt {retry_count} failed, retrying...")
 
 
-def get_eth_balance(user_id: str) -> bool:
-    balance = edu_balance(user_id)["edu_balance"]
+# web3util calls are blocking RPCs, so they run in worker threads off the event loop
+async def get_eth_balance(user_id: str) -> bool:
+    balance = (await asyncio.to_thread(edu_balance, user_id))["edu_balance"]
     return balance > 0
 
 
-def get_token_balance(token: str, user_id: str) -> bool:
-    balance = token_balance(user_id, token)["token_balance"]
+async def get_token_balance(token: str, user_id: str) -> bool:
+    balance = (await asyncio.to_thread(token_balance, user_id, token))["token_balance"]
     return balance > 0
 
 
@@ -579,67 +878,115 @@ async def log_action(action: str, input_data: Any, output_data: Any, user_id: st
         print(f"Error logging action: {str(e)}")
 
 
-async def analyse_texts(queue: List[Dict], user_id: str) -> Any:
+async def analyse_texts(window: WindowSnapshot, user_id: str) -> Any:
     print("Analyzing texts")
-    tg_alpha = get_alpha(queue)
-    await log_action("Get Alpha from Group Texts", queue, tg_alpha, user_id)
+    messages = window.as_dicts()
+    for message, record in zip(messages, window.messages):
+        seen_in = dedup_index.seen_in(record)
+        if seen_in > 1:
+            message["seen_in_groups"] = seen_in
+    new_texts = [message.message_text for message in window.messages[window.overlap:]]
+    score, skip = relevance_gate.check(new_texts)
+    if relevance_gate.mode != OFF and score < relevance_gate.threshold:
+        await log_action(
+            "Relevance Gate Skipped" if skip else "Relevance Gate Would Skip",
+            messages,
+            {"score": score, "threshold": relevance_gate.threshold},
+            user_id,
+        )
+    if skip:
+        return
+    if ALPHA_STREAMING:
+        # Each token starts validation while the model is still writing the next one
+        tg_alpha, evaluations = [], []
+        try:
+            async for token in stream_alpha(messages):
+                tg_alpha.append(token)
+                evaluations.append(asyncio.create_task(evaluate_alpha(token, user_id)))
+        except Exception:
+            # Let the tokens already started finish; the window is not committed
+            await asyncio.gather(*evaluations)
+            raise
+    else:
+        tg_alpha = await get_alpha(messages)
+        evaluations = [evaluate_alpha(token, user_id) for token in tg_alpha]
+    await log_action("Get Alpha from Group Texts", messages, tg_alpha, user_id)
     if len(tg_alpha) == 0:
         await log_action("Analyse Texts", tg_alpha, "No token alphas detected", user_id)
         return
-    for token in tg_alpha:
-        await log_action("Analyse Each Alpha", token, "Analyzing alpha", user_id)
-        if token["sentiment"] == "positive":
-            await log_action(
-                "Check EDU Balance [Alpha is positive so we need to buy using EDU]",
-                token,
-                "Checking EDU balance",
-                user_id
-            )
-            if not get_eth_balance(user_id):
-                await log_action(
-                    "Check EDU Balance", token, "EDU balance is zero", user_id
-                )
-                return
-        elif token["sentiment"] == "negative":
-            await log_action(
-                "Check Token Balance [Alpha is negative so we need to sell the token]",
-                token,
-                "Checking token balance",
-                user_id
+    await asyncio.gather(*evaluations)
+
+
+async def evaluate_alpha(token: Dict, user_id: str):
+    """Validate and trade one token; a failure here never affects the others"""
+    async with token_semaphore:
+        try:
+            await evaluate_token(token, user_id)
+        except Exception as e:
+            print(f"Error evaluating {token.get('token')} for {user_id}: {str(e)}")
+            await log_action("Analyse Each Alpha Failed", token, str(e), user_id)
 
+
+async def evaluate_token(token: Dict, user_id: str):
+    await log_action("Analyse Each Alpha", token, "Analyzing alpha", user_id)
+    if token["sentiment"] == "positive":
+        await log_action(
+            "Check EDU Balance [Alpha is positive so we need to buy using EDU]",
+            token,
+            "Checking EDU balance",
+            user_id
+        )
+        if not await get_eth_balance(user_id):
+            await log_action(
+                "Check EDU Balance", token, "EDU balance is zero", user_id
             )
-            if not get_token_balance(token["token"], user_id):
-                await log_action(
-                    "Check Token Balance", token, "Token balance is zero", user_id
-                )
-                return
-        _, sentiment, valid = await validation_layer(token, user_id)
-        if not valid:
-            await log_action("Validation Layer Declined", token, {
-                "reason": "Token is not valid",
-                "sentiment": sentiment,
-                "validity": valid,
-            }, user_id)
-            return
-        trust, pnl_potential = await trust_layer(sentiment, token, user_id)
-        if not trust:
-            await log_action("Trust Layer Declined", {
-                "token": token,
-                "sentiment": sentiment
-            }, {
-                "reason": "Token is not trusted",
-                "trust": trust,
-                "pnl_potential": pnl_potential,
-            },
-            user_id)
             return
-        if abs(pnl_potential) < 10:
+    elif token["sentiment"] == "negative":
+        await log_action(
+            "Check Token Balance [Alpha is negative so we need to sell the token]",
+            token,
+            "Checking token balance",
+            user_id
+
+        )
+        if not await get_token_balance(token["token"], user_id):
             await log_action(
-                "PNL Potential is too low", pnl_potential, "PNL Potential is too low", user_id
+                "Check Token Balance", token, "Token balance is zero", user_id
             )
             return
+    _, sentiment, valid = await validation_layer(token, user_id)
+    if not valid:
+        await log_action("Validation Layer Declined", token, {
+            "reason": "Token is not valid",
+            "sentiment": sentiment,
+            "validity": valid,
+        }, user_id)
+        return
+    trust, pnl_potential = await trust_layer(sentiment, token, user_id)
+    if not trust:
+        await log_action("Trust Layer Declined", {
+            "token": token,
+            "sentiment": sentiment
+        }, {
+            "reason": "Token is not trusted",
+            "trust": trust,
+            "pnl_potential": pnl_potential,
+        },
+        user_id)
+        return
+    if abs(pnl_potential) < 10:
+        await log_action(
+            "PNL Potential is too low", pnl_potential, "PNL Potential is too low", user_id
+        )
+        return
+    # Balances are read and spent inside the transaction, so one trade at a time per user
+    async with transaction_locks.setdefault(user_id, asyncio.Lock()):
         await transaction_layer(token, user_id)
-    return
+
+
+@app.get("/relevance-metrics")
+async def get_relevance_metrics():
+    return relevance_gate.metrics()
 
 
 @app.get("/get-logs/{user_id}")
@@ -697,22 +1044,23 @@ async def get_token_history_endpoint(user_id: str):
     tokens = await get_token_history(user_id)
     res = []
     for token in tokens:
-        balance = token_balance(user_id, token)
+        balance = await asyncio.to_thread(token_balance, user_id, token)
         res.append({"token": token, "balance": balance})
     return res
 
 
 async def transaction_layer(token: Dict, user_id: str):
+    """Runs under the user's transaction lock, which stays held across the thread calls"""
     await store_token_transaction(user_id, token["token"])
     if token["sentiment"] == "positive":
-        balance = edu_balance(user_id)["edu_balance"]
+        balance = (await asyncio.to_thread(edu_balance, user_id))["edu_balance"]
         if balance > 0:
-            tx = buy_token(user_id, token["token"], balance * 0.6)
+            tx = await asyncio.to_thread(buy_token, user_id, token["token"], balance * 0.6)
             await log_action(f"Buy Token {token['token']}", token, tx, user_id)
     elif token["sentiment"] == "negative":
-        balance = token_balance(user_id, token["token"])["token_balance"]
+        balance = (await asyncio.to_thread(token_balance, user_id, token["token"]))["token_balance"]
         if balance > 0:
-            tx = sell_token(user_id, token["token"], balance)
+            tx = await asyncio.to_thread(sell_token, user_id, token["token"], balance)
             await log_action(f"Sell Token {token['token']}", token, tx, user_id)
 
 
@@ -829,7 +1177,7 @@ async def trust_layer(sentiment: str, token: Dict, user_id: str) -> Tuple[bool,
     return True, pnl_potential
 
 
-def get_tweets(token: Dict) -> List[Dict]:
+async def get_tweets(token: Dict) -> List[Dict]:
     good_bad = (
         "good"
         if random.random() < (0.8 if token["sentiment"] == "positive" else 0.2)
@@ -852,11 +1200,26 @@ def get_tweets(token: Dict) -> List[Dict]:
     }}
     Token name: {token["token"]}
     """
-    response = generate(prompt)
+    return await llm.generate(prompt, kind="tweets", json_mode=True, parse=parse_tweets_reply)
+
+
+# Reply parsers run inside llm.generate, so a reply they reject is never cached
+def parse_tweets_reply(response: str) -> List[str]:
+    if llm.structured:
+        return TweetsResponse.model_validate_json(response).tweets
     return from_json(response, allow_inf_nan=True, allow_partial=True)["tweets"]
 
 
-def analyse_tweets(tweets: List[str], token: str) -> Dict:
+def parse_sentiment_reply(response: str) -> Dict:
+    if llm.structured:
+        return SentimentResponse.model_validate_json(response).model_dump()
+    result = from_json(response, allow_inf_nan=True, allow_partial=True)
+    if not isinstance(result, dict) or "sentiment" not in result:
+        raise ValueError("Sentiment reply has no sentiment")
+    return result
+
+
+async def analyse_tweets(tweets: List[str], token: str) -> Dict:
     prompt = f"""You are an expert cryptocurrency analyst with deep experience in sentiment analysis and market psychology. You are given a list of tweets discussing a specific token.
 
     Your task is to carefully analyze these tweets to determine the overall market sentiment. Consider:
@@ -881,17 +1244,21 @@ def analyse_tweets(tweets: List[str], token: str) -> Dict:
     Tweets to analyze: {tweets}
     Token being discussed: {token}
     """
-    response = generate(prompt)
-    return from_json(response, allow_inf_nan=True, allow_partial=True)
+    return await llm.generate(
+        prompt, kind="sentiment", json_mode=True, parse=parse_sentiment_reply
+    )
 
 
 async def validation_layer(alpha: Dict, user_id: str) -> Tuple[List[str], Dict, bool]:
-    tweets = get_tweets(alpha)
+    tweets = await get_tweets(alpha)
     await log_action("Get Tweets", alpha, tweets, user_id)
-    sentiment = analyse_tweets(tweets, alpha["token"])["sentiment"]
+    analysis = await sentiment_backend.analyse(tweets, alpha["token"])
+    sentiment = analysis["sentiment"]
     await log_action("Analyse Tweets", {
         "token": alpha["token"],
         "tweets": tweets,
+        "backend": analysis["backend"],
+        "confidence": analysis["confidence"],
     }, sentiment, user_id)
     if not sentiment == alpha["sentiment"]:
         await log_action("Validation Layer", {
@@ -908,10 +1275,7 @@ async def validation_layer(alpha: Dict, user_id: str) -> Tuple[List[str], Dict,
     return tweets, sentiment, True
 
 
-def get_alpha(queue: List[Dict]):
-    prompt = f"""You are an expect cryptocurrency analyst with deep knowledge of tokens, DeFi protocols, and market trends. Analyze the following group chat messages and:
-
-1. Identify any cryptocurrency tokens being discussed, including:
+ALPHA_TASK = """1. Identify any cryptocurrency tokens being discussed, including:
    - Direct token mentions (e.g. BTC, ETH)
    - Indirect references (e.g. "the blue chip", "Vitalik's creation")
    - Related protocol/platform tokens
@@ -924,147 +1288,194 @@ def get_alpha(queue: List[Dict]):
      * Market outlook
      * User reactions
 
-3. If the messages are overlap message, only take them into account if they are relevant to the non-overlap messages.
+3. Messages are given one per line as "sender: text" under a "Group" header. Lines starting with "~" are overlap messages, only take them into account if they are relevant to the non-overlap messages.
+   An "(xN groups)" suffix means the same message was cross-posted to that many watched groups. Links are shortened to <domain> plus any contract address they contained."""
 
-3. Return results in this JSON format:
-[
-    {{
+ALPHA_ITEM_FORMAT = """{
         "token": "token_symbol", 
         "texts": ["relevant message 1", "relevant message 2"],
         "sentiment": "positive/negative",
         "confidence": 0.8  // How confident the token identification is (0-1)
-    }},
+    }"""
+
+
+async def get_alpha(queue: List[Dict]):
+    """Extract token alphas from one window, batched with windows flushing alongside it"""
+    return await alpha_batcher.submit(queue)
+
+
+async def get_alpha_batch(queues: List[List[Dict]]) -> List[List[Dict]]:
+    if not cascade.enabled:
+        return await run_alpha(queues)
+
+    started = time.monotonic()
+    results = await run_alpha(queues, cascade.fast_model)
+    cascade.record("fast", len(queues), time.monotonic() - started)
+    escalate = cascade.route(results)
+    if escalate:
+        started = time.monotonic()
+        retried = await run_alpha([queues[i] for i in escalate], cascade.strong_model)
+        cascade.record("strong", len(escalate), time.monotonic() - started)
+        for index, tokens in zip(escalate, retried):
+            results[index] = tokens
+    return results
+
+
+async def run_alpha(queues: List[List[Dict]], model: str = None) -> List[List[Dict]]:
+    if len(queues) == 1:
+        return [await extract_alpha(queues[0], model)]
+    return await extract_alpha_batch(queues, model)
+
+
+def alpha_prompt(queue: List[Dict], structured: bool = False) -> str:
+    if structured:
+        # JSON mode only returns objects, so the list is wrapped in "tokens"
+        response_format = f"""4. Return results as a JSON object in this format:
+{{
+    "tokens": [
+        {ALPHA_ITEM_FORMAT},
+        ...
+    ]
+}}
+
+Return an empty "tokens" list if no tokens detected."""
+    else:
+        response_format = f"""3. Return results in this JSON format:
+[
+    {ALPHA_ITEM_FORMAT},
     ...
 ]
 
-Return empty list if no tokens detected.
+Return empty list if no tokens detected."""
+    return f"""You are an expect cryptocurrency analyst with deep knowledge of tokens, DeFi protocols, and market trends. Analyze the following group chat messages and:
+
+{ALPHA_TASK}
+
+{response_format}
 
-Messages to analyze: {queue}"""
-    response = generate(prompt)
+Messages to analyze:
+{compact_window(queue, PROMPT_TOKEN_BUDGET, PROMPT_MESSAGE_CHARS)}"""
+
+
+def parse_alpha_reply(response: str) -> List[Dict]:
+    if llm.structured:
+        return parse_alphas(response)
     return from_json(response, allow_inf_nan=True, allow_partial=True)
 
 
-@app.get("/user-groups/{user_id}")
-async def get_user_groups(user_id: str):
+async def extract_alpha(queue: List[Dict], model: str = None):
+    return await llm.generate(
+        alpha_prompt(queue, llm.structured),
+        kind="alpha",
+        model=model,
+        json_mode=True,
+        parse=parse_alpha_reply,
+    )
+
+
+async def stream_alpha(queue: List[Dict]) -> AsyncIterator[Dict]:
+    """Yield each token alpha as soon as the model has finished writing it"""
+    async for token in iter_array_items(llm.stream(alpha_prompt(queue), kind="alpha")):
+        yield token
+
+
+def parse_alpha_batch_reply(response: str) -> Tuple[Dict, bool]:
+    """Per-window results keyed by window_id, and whether the reply was cut off"""
+    truncated = False
     try:
-        user = await db[COLLECTION_NAME].find_one({"user_id": user_id})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not registered")
+        results = from_json(response, allow_inf_nan=True)
+    except ValueError:
+        if llm.structured:
+            raise
+        # A cut-off reply: keep the windows it finished, redo the rest
+        results = from_json(response, allow_inf_nan=True, allow_partial=True)
+        truncated = True
+    if not isinstance(results, dict):
+        raise ValueError("Batched alpha response is not keyed by window_id")
+    return results, truncated
+
+
+async def extract_alpha_batch(queues: List[List[Dict]], model: str = None) -> List[List[Dict]]:
+    """One prompt for several windows; results are keyed by window id and split back"""
+    windows_text = "\n\n".join(
+        f"window_id {window_id}:\n"
+        + compact_window(queue, PROMPT_TOKEN_BUDGET, PROMPT_MESSAGE_CHARS)
+        for window_id, queue in enumerate(queues)
+    )
+    prompt = f"""You are an expect cryptocurrency analyst with deep knowledge of tokens, DeFi protocols, and market trends. Below are several independent group chat windows, each with a window_id. Analyze every window separately, never mixing messages between windows, and:
 
-        session = decrypt_data(user["session_string"])
-        client = TelegramClient(
-            StringSession(session), user["api_id"], decrypt_data(user["api_hash"])
-        )
+{ALPHA_TASK}
 
-        try:
-            await client.connect()
-            if not await client.is_user_authorized():
-                raise HTTPException(status_code=401, detail="Session expired")
-
-            dialogs = await client.get_dialogs()
-
-            regular_groups = []
-            super_groups = []
-            channels = []
-            dialog_dict = {}
-            for key, value in dialogs[0].__dict__.items():
-                if hasattr(value, "__dict__"):
-                    nested_dict = {}
-                    for k, v in value.__dict__.items():
-                        if isinstance(v, StringSession):
-                            continue
-                        elif hasattr(v, "__dict__"):
-                            nested_dict[k] = str(v)
-                        elif isinstance(v, datetime):
-                            nested_dict[k] = v.isoformat()
-                        else:
-                            nested_dict[k] = str(v)
-                    dialog_dict[key] = nested_dict
-                elif isinstance(value, datetime):
-                    dialog_dict[key] = value.isoformat()
-                elif isinstance(value, StringSession):
-                    continue
-                else:
-                    dialog_dict[key] = str(value)
-
-            for dialog in dialogs:
-                if getattr(
-                        dialog.entity, "participants_count", None
-                    ) is None or getattr(dialog.entity, "participants_count", None) < 1:
-                    continue
-                group_info = {
-                    "id": getattr(dialog.entity, "id", None),
-                    "title": dialog.title,
-                    "participants_count": getattr(
-                        dialog.entity, "participants_count", None
-                    ),
-                    "username": getattr(dialog.entity, "username", None),
-                    "description": getattr(dialog.entity, "about", None),
-                }
+4. Return results in this JSON format, with one key per window_id:
+{{
+    "0": [
+        {ALPHA_ITEM_FORMAT},
+        ...
+    ],
+    "1": [],
+    ...
+}}
 
-                if dialog.is_channel:
-                    if getattr(dialog.entity, "megagroup", False):
-                        group_info["type"] = "supergroup"
-                        super_groups.append(group_info)
-                    else:
-                        group_info["type"] = "channel"
-                        channels.append(group_info)
-                elif dialog.is_group:
-                    group_info["type"] = "group"
-                    regular_groups.append(group_info)
-
-            for group in super_groups:
-                try:
-                    entity = await client.get_entity(group["id"])
-                    if getattr(entity, "forum", False):
-                        topics = await client(
-                            functions.channels.GetForumTopicsRequest(
-                                channel=entity,
-                                offset_date=0,
-                                offset_id=0,
-                                offset_topic=0,
-                                limit=100,
-                            )
-                        )
-
-                        group["is_forum"] = True
-                        group["topics"] = []
-
-                        for topic in topics.topics:
-                            group["topics"].append(
-                                {
-                                    "id": topic.id,
-                                    "title": topic.title,
-                                    "icon_color": (
-                                        topic.icon_color
-                                        if hasattr(topic, "icon_color")
-                                        else None
-                                    ),
-                                    "icon_emoji": (
-                                        topic.icon_emoji
-                                        if hasattr(topic, "icon_emoji")
-                                        else None
-                                    ),
-                                }
-                            )
-                    else:
-                        group["is_forum"] = False
-                except Exception as e:
-                    group["is_forum"] = False
-                    group["topics_error"] = str(e)
+Use an empty list for a window with no tokens detected.
 
-            return {
-                "regular_groups": regular_groups if len(regular_groups) > 0 else [],
-                "supergroups": super_groups if len(super_groups) > 0 else [],
-                "channels": channels if len(channels) > 0 else [],
-            }
+Windows to analyze:
+
+{windows_text}"""
+    try:
+        results, truncated = await llm.generate(
+            prompt,
+            kind="alpha",
+            model=model,
+            json_mode=True,
+            max_tokens=llm.max_tokens.get("alpha", 1024) * len(queues),
+            parse=parse_alpha_batch_reply,
+        )
+    except ValueError as e:
+        print(f"Batched alpha reply unusable: {str(e)}")
+        results, truncated = {}, False
+    if truncated and results:
+        # The last key was still being written when the reply stopped
+        results.pop(list(results)[-1])
+
+    alphas: List[Any] = [None] * len(queues)
+    unanswered = []
+    for window_id in range(len(queues)):
+        items = results.get(str(window_id))
+        if not isinstance(items, list):
+            unanswered.append(window_id)
+        else:
+            alphas[window_id] = validate_alphas(items) if llm.structured else items
+    if unanswered:
+        # Only these windows are retried; a window the model never answered
+        # must not be committed as analysed
+        print(f"Batched alpha reply missed {len(unanswered)} windows, retrying them one by one")
+        retried = await asyncio.gather(
+            *(extract_alpha(queues[i], model) for i in unanswered), return_exceptions=True
+        )
+        for window_id, tokens in zip(unanswered, retried):
+            alphas[window_id] = tokens
+    return alphas
 
-        finally:
-            await client.disconnect()
+
+@app.get("/user-groups/{user_id}")
+async def get_user_groups(user_id: str, refresh: bool = False):
+    try:
+        connection = await get_user_connection(user_id)
+        dialog_index = await dialog_indexes.get(user_id, connection, refresh)
+        return dialog_index.as_response()
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+
+@app.get("/telegram-scheduler/{user_id}")
+async def get_telegram_scheduler(user_id: str):
+    connection = connections.get(user_id)
+    if not connection:
+        raise HTTPException(status_code=404, detail="User not connected")
+    return connection.scheduler.status()
+
+
 @app.post("/get_keys")
 async def get_keys(request):
     my_private_key = os.getenv("APTOS_PRIVATE_KEY")
@@ -1109,13 +1520,14 @@ async def verify_otp(request: VerifyOTPRequest):
     await store_keys(my_private_key, request.user_id, private_key_hex)
 
     await db[COLLECTION_NAME].insert_one(user_data)
+    vault.invalidate(request.user_id)
 
     try:
         await init_message_listener(
             request.user_id,
             user_data["api_id"],
-            decrypt_data(user_data["api_hash"]),
-            decrypt_data(user_data["session_string"]),
+            client.api_hash,
+            session_string,
         )
     except Exception as e:
         print(f"Failed to start listener for new user {request.user_id}: {str(e)}")
@@ -1128,15 +1540,43 @@ async def verify_otp(request: VerifyOTPRequest):
 
 @app.post("/send-message")
 async def send_message(
-    request: SendMessageRequest, client: TelegramClient = Depends(get_user_client)
+    request: SendMessageRequest,
+    connection: UserConnection = Depends(get_user_connection),
 ):
     try:
-        await client.send_message(request.recipient, request.message)
+        await connection.send_message(request.recipient, request.message)
         return {"status": "Message sent"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await client.disconnect()
+
+
+@app.post("/send-messages")
+async def send_messages(
+    request: BulkSendMessageRequest,
+    connection: UserConnection = Depends(get_user_connection),
+):
+    """Send many messages concurrently; each recipient still gets them in order"""
+    by_recipient: Dict[str, List[int]] = {}
+    for i, item in enumerate(request.messages):
+        by_recipient.setdefault(item.recipient, []).append(i)
+
+    results: List[Dict] = [None] * len(request.messages)
+    semaphore = asyncio.Semaphore(BULK_SEND_CONCURRENCY)
+
+    async def send_to(recipient: str, indices: List[int]):
+        async with semaphore:
+            for i in indices:
+                try:
+                    await connection.send_message(recipient, request.messages[i].message)
+                    results[i] = {"recipient": recipient, "status": "Message sent"}
+                except Exception as e:
+                    results[i] = {"recipient": recipient, "status": "error", "detail": str(e)}
+
+    await asyncio.gather(
+        *(send_to(recipient, indices) for recipient, indices in by_recipient.items())
+    )
+    sent = sum(1 for result in results if result["status"] == "Message sent")
+    return {"sent": sent, "failed": len(results) - sent, "results": results}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import AsyncIterator, Dict, List, Tuple
+
+from telethon import errors
+
+from rate_limit import TokenBucket
+
+
+# Method classes in priority order: live message handling first, UI listings last
+PRIORITIES = {
+    "live": 0,
+    "send": 1,
+    "resolve": 2,
+    "history": 3,
+    "listing": 4,
+}
+
+DEFAULT_RATES = {
+    "live": 20.0,
+    "send": 20.0,
+    "resolve": 5.0,
+    "history": 5.0,
+    "listing": 2.0,
+}
+
+
+class RequestScheduler:
+    """Per-account gate every outbound Telegram request goes through
+
+    Each method class has its own token bucket and flood-wait deadline. A
+    ``FloodWaitError`` parks only that class until the deadline passes, and
+    short waits are retried. When all ``max_in_flight`` slots are busy, the
+    highest-priority waiter gets the next free slot.
+    """
+
+    def __init__(
+        self,
+        rates: Dict[str, float] = None,
+        max_in_flight: int = 8,
+        max_flood_wait: float = 300,
+        retries: int = 2,
+    ):
+        rates = {**DEFAULT_RATES, **(rates or {})}
+        self.buckets = {cls: TokenBucket(rate) for cls, rate in rates.items()}
+        self.flood_until: Dict[str, float] = {}
+        self.max_in_flight = max_in_flight
+        self.max_flood_wait = max_flood_wait
+        self.retries = retries
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.stats = {
+            cls: {"calls": 0, "flood_waits": 0, "flood_seconds": 0}
+            for cls in rates
+        }
+
+    async def _acquire_slot(self, priority: int):
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot was handed over just as we were cancelled; pass it on
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def _admit(self, method_class: str):
+        deadline = self.flood_until.get(method_class, 0)
+        if deadline > time.monotonic():
+            await asyncio.sleep(deadline - time.monotonic())
+        await self.buckets[method_class].acquire()
+
+    def _flooded(self, method_class: str, e: errors.FloodWaitError):
+        self.flood_until[method_class] = time.monotonic() + e.seconds
+        self.stats[method_class]["flood_waits"] += 1
+        self.stats[method_class]["flood_seconds"] += e.seconds
+        print(f"Flood wait of {e.seconds}s on '{method_class}' requests")
+
+    async def call(self, method_class: str, func, *args, **kwargs):
+        """Run one request, honouring flood waits, rate limits and priority"""
+        priority = PRIORITIES[method_class]
+        for attempt in range(self.retries + 1):
+            await self._admit(method_class)
+            await self._acquire_slot(priority)
+            try:
+                self.stats[method_class]["calls"] += 1
+                return await func(*args, **kwargs)
+            except errors.FloodWaitError as e:
+                self._flooded(method_class, e)
+                if e.seconds > self.max_flood_wait or attempt == self.retries:
+                    raise
+            finally:
+                self._release_slot()
+
+    async def iterate(
+        self, method_class: str, iterator: AsyncIterator, chunk: int = 100
+    ) -> AsyncIterator:
+        """Gate a paginating Telethon iterator once per ``chunk`` items
+
+        The in-flight slot is held while fetching an item that starts a new
+        page, which is when the iterator makes its request.
+        """
+        priority = PRIORITIES[method_class]
+        count = 0
+        while True:
+            new_page = count % chunk == 0
+            if new_page:
+                await self._admit(method_class)
+                await self._acquire_slot(priority)
+                self.stats[method_class]["calls"] += 1
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except errors.FloodWaitError as e:
+                self._flooded(method_class, e)
+                raise
+            finally:
+                if new_page:
+                    self._release_slot()
+            count += 1
+            yield item
+
+    def status(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "flood_wait_remaining": {
+                cls: round(deadline - now, 1)
+                for cls, deadline in self.flood_until.items()
+                if deadline > now
+            },
+            "classes": self.stats,
+        }
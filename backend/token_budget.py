@@ -0,0 +1,15 @@
+import re
+
+
+PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Fast BPE-ish estimate: short words are one token, long words one per ~4 characters
+
+    Shared by window flushing, prompt compaction and LLM admission so their
+    budgets are measured the same way.
+    """
+    return sum(
+        (len(piece) + 3) // 4 if piece[0].isalnum() else 1 for piece in PIECE.findall(text)
+    )
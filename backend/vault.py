@@ -0,0 +1,103 @@
+import asyncio
+from typing import List, NamedTuple, Optional
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+from ttl_cache import TTLCache
+
+
+class Credentials(NamedTuple):
+    user_id: str
+    api_id: int
+    api_hash: str
+    session_string: str
+
+
+class CredentialVault:
+    """Decrypts user credentials once and keeps them in a bounded cache
+
+    ``keys`` are Fernet keys, newest first. Tokens encrypted under any of them
+    decrypt; new tokens always use the first. ``rotate`` re-encrypts stored
+    credentials under the first key in the background.
+    """
+
+    ENCRYPTED_FIELDS = ("api_hash", "session_string")
+
+    def __init__(self, collection, keys: List[str], maxsize: int = 1024, ttl: Optional[float] = None):
+        self.collection = collection
+        self.primary = Fernet(keys[0])
+        self.fernet = MultiFernet([Fernet(key) for key in keys])
+        self.rotating = len(keys) > 1
+        self.cache = TTLCache(maxsize, ttl)
+
+    def encrypt(self, data: str) -> str:
+        return self.fernet.encrypt(data.encode()).decode()
+
+    def decrypt(self, encrypted_data: str) -> str:
+        return self.fernet.decrypt(encrypted_data.encode()).decode()
+
+    def load(self, user: dict) -> Credentials:
+        """Decrypt an already fetched user document and cache the result"""
+        credentials = self.cache.get(user["user_id"])
+        if credentials is None:
+            credentials = Credentials(
+                user["user_id"],
+                user["api_id"],
+                self.decrypt(user["api_hash"]),
+                self.decrypt(user["session_string"]),
+            )
+            self.cache.set(user["user_id"], credentials)
+        return credentials
+
+    async def get(self, user_id: str) -> Optional[Credentials]:
+        credentials = self.cache.get(user_id)
+        if credentials is not None:
+            return credentials
+        user = await self.collection.find_one({"user_id": user_id})
+        if not user:
+            return None
+        return self.load(user)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(user_id)
+
+    def _needs_rotation(self, token: str) -> bool:
+        try:
+            self.primary.decrypt(token.encode())
+            return False
+        except InvalidToken:
+            return True
+
+    def _rotate_user(self, user: dict) -> dict:
+        return {
+            field: self.fernet.rotate(user[field].encode()).decode()
+            for field in self.ENCRYPTED_FIELDS
+            if self._needs_rotation(user[field])
+        }
+
+    async def rotate(self, batch_size: int = 100) -> int:
+        """Re-encrypt every stored credential under the primary key, batch by batch"""
+        rotated = 0
+        batch = []
+        async for user in self.collection.find({}, {"user_id": 1, **{f: 1 for f in self.ENCRYPTED_FIELDS}}):
+            batch.append(user)
+            if len(batch) >= batch_size:
+                rotated += await self._rotate_batch(batch)
+                batch = []
+        if batch:
+            rotated += await self._rotate_batch(batch)
+        print(f"Re-encrypted credentials for {rotated} users under the primary key")
+        return rotated
+
+    async def _rotate_batch(self, users: List[dict]) -> int:
+        # Crypto runs off the event loop so request paths are never blocked
+        updates = await asyncio.to_thread(lambda: [self._rotate_user(user) for user in users])
+        rotated = 0
+        for user, update in zip(users, updates):
+            if update:
+                await self.collection.update_one({"_id": user["_id"]}, {"$set": update})
+                rotated += 1
+        return rotated
@@ -0,0 +1,179 @@
+import time
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from ingest import IngestRecord
+from token_budget import count_tokens
+
+
+WindowKey = Tuple[str, int, Optional[int]]
+
+
+def estimate_tokens(record: IngestRecord) -> int:
+    """Prompt tokens of the message's ``sender: text`` line, as compact_window counts it"""
+    return count_tokens(f"{record.sender_name}: {record.message_text or ''}") + 1
+
+
+class FlushPolicy(NamedTuple):
+    """Flush a window on whichever trigger fires first"""
+
+    max_messages: int = 8  # new messages since the last flush
+    max_age: float = 60.0  # seconds since the first unflushed message
+    max_tokens: int = 1500  # estimated prompt tokens of the new messages
+
+
+class WindowSnapshot(NamedTuple):
+    """Immutable view of one flushed window, shared with the analyser as-is"""
+
+    key: WindowKey
+    messages: Tuple[IngestRecord, ...]
+    overlap: int  # leading messages already seen by the previous flush
+    seq: int = 0  # flush number within the conversation, in flush order
+
+    def as_dicts(self) -> List[Dict]:
+        return [
+            {
+                "group_name": message.group_name,
+                "topic_name": message.topic_name,
+                "sender_name": message.sender_name,
+                "message_text": message.message_text,
+                "user_id": message.user_id,
+                "overlap": index < self.overlap,
+            }
+            for index, message in enumerate(self.messages)
+        ]
+
+
+class ConversationWindow:
+    """Fixed-capacity sliding window over one (user, chat, topic) conversation"""
+
+    def __init__(self, key: WindowKey, policy: FlushPolicy, overlap: int):
+        self.key = key
+        self.policy = policy
+        self.overlap = overlap
+        self.messages: Deque[IngestRecord] = deque(
+            maxlen=overlap + policy.max_messages
+        )
+        self.tokens = 0
+        self.fresh = 0
+        self.fresh_tokens = 0
+        self.first_fresh_at: Optional[float] = None
+        self.flushes = 0
+
+    @property
+    def deadline(self) -> Optional[float]:
+        if self.first_fresh_at is None:
+            return None
+        return self.first_fresh_at + self.policy.max_age
+
+    def append(self, record: IngestRecord) -> Optional[WindowSnapshot]:
+        """Add a message; return a snapshot if the size or token trigger fired
+
+        A message that would take the new messages over ``max_tokens`` flushes
+        the window before it is added, so a snapshot's new messages always fit
+        the budget; that message then starts the next window.
+        """
+        cost = estimate_tokens(record)
+        snapshot = None
+        if self.fresh and self.fresh_tokens + cost > self.policy.max_tokens:
+            snapshot = self.flush()
+
+        if len(self.messages) == self.messages.maxlen:
+            evicted = estimate_tokens(self.messages[0])
+            self.tokens -= evicted
+            if self.fresh == len(self.messages):
+                self.fresh_tokens -= evicted
+        self.messages.append(record)
+        self.tokens += cost
+        self.fresh_tokens += cost
+        self.fresh = min(self.fresh + 1, self.messages.maxlen)
+        if self.first_fresh_at is None:
+            self.first_fresh_at = time.monotonic()
+
+        if snapshot:
+            return snapshot
+        # Overlap carried over from the last flush does not count towards the
+        # budget, or a few long messages would re-trigger a flush on every append
+        if (
+            self.fresh >= self.policy.max_messages
+            or self.fresh_tokens >= self.policy.max_tokens
+        ):
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[WindowSnapshot]:
+        if not self.fresh:
+            return None
+        snapshot = WindowSnapshot(
+            self.key, tuple(self.messages), len(self.messages) - self.fresh, self.flushes
+        )
+        self.flushes += 1
+        # Only the last ``overlap`` messages carry over as context
+        while len(self.messages) > self.overlap:
+            self.tokens -= estimate_tokens(self.messages.popleft())
+        self.fresh = 0
+        self.fresh_tokens = 0
+        self.first_fresh_at = None
+        return snapshot
+
+    def summary(self) -> Dict:
+        user_id, group_id, topic_id = self.key
+        last = self.messages[-1] if self.messages else None
+        return {
+            "user_id": user_id,
+            "group_id": group_id,
+            "topic_id": topic_id,
+            "group_name": last.group_name if last else None,
+            "topic_name": last.topic_name if last else None,
+            "size": len(self.messages),
+            "pending": self.fresh,
+            "tokens": self.tokens,
+            "pending_tokens": self.fresh_tokens,
+            "policy": self.policy._asdict(),
+        }
+
+
+class ConversationWindows:
+    """Sliding windows for every watched conversation"""
+
+    def __init__(self, overlap: int = 3, default_policy: FlushPolicy = FlushPolicy()):
+        if overlap < 0 or default_policy.max_messages < 1:
+            raise ValueError("Window overlap must be >= 0 and max_messages >= 1")
+        self.overlap = overlap
+        self.default_policy = default_policy
+        self.policies: Dict[WindowKey, FlushPolicy] = {}
+        self.windows: Dict[WindowKey, ConversationWindow] = {}
+
+    def set_policy(self, key: WindowKey, policy: Optional[FlushPolicy]):
+        """Tune one conversation; ``None`` falls back to the default policy"""
+        if policy is None:
+            self.policies.pop(key, None)
+        else:
+            self.policies[key] = policy
+        window = self.windows.pop(key, None)
+        if window:
+            # Rebuild with the new capacity, keeping what is already buffered
+            replacement = self.get(key)
+            replacement.messages.extend(window.messages)
+            replacement.tokens = sum(estimate_tokens(record) for record in replacement.messages)
+            replacement.fresh = min(window.fresh, len(replacement.messages))
+            fresh = list(replacement.messages)[len(replacement.messages) - replacement.fresh:]
+            replacement.fresh_tokens = sum(estimate_tokens(record) for record in fresh)
+            replacement.first_fresh_at = window.first_fresh_at
+            replacement.flushes = window.flushes
+
+    def get(self, key: WindowKey) -> ConversationWindow:
+        window = self.windows.get(key)
+        if window is None:
+            policy = self.policies.get(key, self.default_policy)
+            window = ConversationWindow(key, policy, self.overlap)
+            self.windows[key] = window
+        return window
+
+    def append(self, record: IngestRecord) -> Tuple[ConversationWindow, Optional[WindowSnapshot]]:
+        key = (record.user_id, record.group_id, record.topic_id)
+        window = self.get(key)
+        return window, window.append(record)
+
+    def summary(self) -> List[Dict]:
+        return [window.summary() for window in self.windows.values()]